@@ -2,7 +2,8 @@ import streamlit as st
 import os
 import traceback
 
-from components.ui import sidebar, main_content
+from components.ui import sidebar, main_content, new_conversation_id
+from processors.document_processor import DEFAULT_TENANT
 
 # import streamlit.watcher.local_sources_watcher
 # original_get_module_paths = streamlit.watcher.local_sources_watcher.get_module_paths
@@ -45,11 +46,15 @@ if "interface_ready" not in st.session_state:
     st.session_state.interface_ready = False
 if "startup_error" not in st.session_state:
     st.session_state.startup_error = None
+if "tenant" not in st.session_state:
+    st.session_state.tenant = DEFAULT_TENANT
+if "conversation_id" not in st.session_state:
+    st.session_state.conversation_id = st.query_params.get("conversation") or new_conversation_id()
 
 # Initializing models on startup
 try:
-    from processors.document_processor import initialize_models, check_vectorstore_exists, load_vectorstore
-    from components.graph import initialize_graph
+    from processors.document_processor import initialize_models, check_vectorstore_exists, load_vectorstore, create_retriever
+    from components.graph import initialize_graph, get_checkpointer, load_conversation
 
     # Function to initialize everything
     def initialize_all_components():
@@ -63,15 +68,18 @@ try:
             # Initializing graph even if no documents are present yet
             if st.session_state.graph is None:
                 with st.spinner("Initializing agent graph..."):
-                    st.session_state.graph = initialize_graph()
+                    st.session_state.graph = initialize_graph(get_checkpointer())
+                    # Resuming from the conversation's latest checkpoint
+                    st.session_state.messages = load_conversation(st.session_state.graph, st.session_state.conversation_id)
             
             # Check if documents already exist and load them
-            if check_vectorstore_exists() and st.session_state.vectorstore is None:
+            if check_vectorstore_exists(st.session_state.tenant) and st.session_state.vectorstore is None:
                 with st.spinner("Loading existing document database..."):
-                    vectorstore = load_vectorstore()
+                    vectorstore = load_vectorstore(st.session_state.tenant)
                     if vectorstore:
                         st.session_state.vectorstore = vectorstore
-                        st.session_state.retriever = vectorstore.as_retriever()
+                        st.session_state.retriever = create_retriever(vectorstore)
+                        st.session_state.loaded_tenant = st.session_state.tenant
             
             st.session_state.interface_ready = True
             return True
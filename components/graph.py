@@ -1,13 +1,37 @@
+import os
+import sqlite3
 from langgraph.graph import StateGraph, START, END
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.prebuilt import tools_condition
 
 from nodes.state import GraphState
 from nodes.router import chat_router, decide_betn_respond_retrieve_toolcall
 from nodes.processor import retrieve, generate, responder
-from nodes.tools import tools_node
+from nodes.tools import tools_node, call_tools
+from nodes.compressor import compress
 from nodes.grader import grade_documents, transform_query, decide_to_generate, grade_generation_v_documents_and_question
 from utils.graph_tracer import graph_tracer
 
-def initialize_graph():
+CHECKPOINT_DATABASE = os.path.join(os.getcwd(), "checkpoints.db")
+
+# Global checkpointer, one SQLite connection shared by every graph in the process
+graph_checkpointer = None
+
+def get_checkpointer():
+    """Get or open the checkpointer persisting conversation state by thread_id."""
+    global graph_checkpointer
+    if graph_checkpointer is None:
+        connection = sqlite3.connect(CHECKPOINT_DATABASE, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        graph_checkpointer = SqliteSaver(connection)
+    return graph_checkpointer
+
+def load_conversation(graph, conversation_id):
+    """Get the messages of a conversation from its latest checkpoint."""
+    snapshot = graph.get_state({"configurable": {"thread_id": conversation_id}})
+    return snapshot.values.get("messages", [])
+
+def initialize_graph(checkpointer=None):
     """Initializing the graph for the chat agent."""
 
     graph_tracer.clear_trace()
@@ -16,9 +40,11 @@ def initialize_graph():
     
     workflow.add_node("chat", chat_router)
     workflow.add_node("responder", responder)
+    workflow.add_node("call_tools", call_tools)
     workflow.add_node("tools", tools_node)
     workflow.add_node("retrieve", retrieve)
     workflow.add_node("grade_documents", grade_documents)
+    workflow.add_node("compress", compress)
     workflow.add_node("generate", generate)
     workflow.add_node("transform_query", transform_query)
 
@@ -29,12 +55,22 @@ def initialize_graph():
         decide_betn_respond_retrieve_toolcall,
         {
             "respond": "responder",
-            "tools": "tools",
+            "tools": "call_tools",
             "retrieve": "retrieve",
             "end": END,
         }
     )
     
+    # The chat model either requests tool calls or answers directly
+    workflow.add_conditional_edges(
+        "call_tools",
+        tools_condition,
+        {
+            "tools": "tools",
+            END: "chat",
+        }
+    )
+    
     workflow.add_edge("tools", "chat")
     workflow.add_edge("responder", "chat")
     workflow.add_edge("retrieve", "grade_documents")
@@ -44,10 +80,12 @@ def initialize_graph():
         decide_to_generate,
         {
             "transform_query": "transform_query",
-            "generate": "generate",
+            "generate": "compress",
         },
     )
     
+    workflow.add_edge("compress", "generate")
+    
     workflow.add_edge("transform_query", "retrieve")
     
     workflow.add_conditional_edges(
@@ -60,6 +98,6 @@ def initialize_graph():
         },
     )
     
-    graph = workflow.compile(checkpointer=None)
+    graph = workflow.compile(checkpointer=checkpointer)
     
     return graph 
\ No newline at end of file
@@ -1,20 +1,86 @@
+import uuid
 import streamlit as st
 from langchain_core.messages import HumanMessage
 from processors.document_processor import (
-    process_document, 
-    create_vectorstore, 
     check_vectorstore_exists,
-    get_document_count,
+    get_shard_stats,
+    refresh_vectorstore,
+    create_retriever,
+    DEFAULT_TENANT,
 )
+from processors.asset_store import asset_path
+from processors.jobs import JobQueue, DONE, FAILED
+
+JOB_STATUS_ICONS = {"queued": "⏳", "running": "⚙️", "done": "✅", "failed": "❌"}
+
+def get_job_queue():
+    """Get the ingestion job queue for this session."""
+    if "job_queue" not in st.session_state:
+        st.session_state.job_queue = JobQueue()
+    return st.session_state.job_queue
+
+def new_conversation_id():
+    """Start a conversation ID, kept in the URL so a reload or restart resumes it."""
+    conversation_id = uuid.uuid4().hex
+    st.query_params["conversation"] = conversation_id
+    return conversation_id
+
+def current_tenant():
+    """Get the tenant selected in the sidebar."""
+    return st.session_state.tenant.strip() or DEFAULT_TENANT
+
+def load_tenant_vectorstore():
+    """Load the selected tenant's shards into the session."""
+    vectorstore = refresh_vectorstore(current_tenant())
+    st.session_state.vectorstore = vectorstore
+    st.session_state.retriever = create_retriever(vectorstore) if vectorstore else None
+    st.session_state.loaded_tenant = current_tenant()
+
+@st.fragment(run_every=3)
+def job_status():
+    """Poll ingestion jobs and pick up newly indexed documents."""
+    queue = get_job_queue()
+    jobs = queue.list_jobs(tenant=current_tenant())
+    if not jobs:
+        return
+
+    st.subheader("Ingestion Jobs")
+    for job in jobs:
+        st.write(f"{JOB_STATUS_ICONS.get(job['status'], '')} {job['filename']} ({job['status']})")
+        if job["status"] == FAILED:
+            st.caption(job["error"])
+
+    # Reloading the vectorstore whenever a worker has finished another of this tenant's documents
+    done_count = queue.count_done(tenant=current_tenant())
+    if done_count != st.session_state.get("jobs_done", 0):
+        st.session_state.jobs_done = done_count
+        load_tenant_vectorstore()
+        st.session_state.processed_docs = [job["result"] for job in reversed(jobs) if job["status"] == DONE]
+        # The document list and shard stats render outside this fragment
+        st.rerun()
 
 def sidebar():
     """Create sidebar for document upload and processing."""
     st.sidebar.title("📄 Document Upload")
     
-    # Showing document stats if vectorstore exists
-    if check_vectorstore_exists():
-        doc_count = get_document_count()
-        st.sidebar.success(f"Found existing document database with {doc_count} documents")
+    # Switching to another tenant's shards
+    st.sidebar.text_input("Tenant", key="tenant")
+    tenant = current_tenant()
+    if st.session_state.get("loaded_tenant") != tenant:
+        load_tenant_vectorstore()
+        st.session_state.jobs_done = 0
+        st.session_state.processed_docs = []
+    
+    # Showing per-shard stats if the tenant has documents
+    shard_stats = get_shard_stats(tenant)
+    if shard_stats:
+        chunk_count = sum(stat["chunks"] for stat in shard_stats)
+        st.sidebar.success(f"Found existing document database with {chunk_count} chunks in {len(shard_stats)} shards")
+        with st.sidebar.expander("Shard statistics"):
+            st.table([
+                {"Type": stat["document_type"], "Chunks": stat["chunks"], "Collection": stat["collection"]}
+                for stat in shard_stats
+            ])
     
     uploaded_files = st.sidebar.file_uploader(
         "Upload documents (PDF, JPG, PNG)",
@@ -25,25 +91,14 @@ def sidebar():
     if uploaded_files:
         process_button = st.sidebar.button("Process Documents")
         if process_button:
-            with st.sidebar.status("Processing documents..."):
-                processed_docs = []
-                for file in uploaded_files:
-                    st.sidebar.write(f"Processing {file.name}...")
-                    doc = process_document(file)
-                    if doc:
-                        processed_docs.append(doc)
-                
-                if processed_docs:
-                    st.session_state.processed_docs = processed_docs
-                    st.sidebar.success(f"Successfully processed {len(processed_docs)} documents!")
-                    
-                    # Creating vectorstore from processed documents
-                    with st.sidebar.status("Creating vectorstore..."):
-                        vectorstore = create_vectorstore(processed_docs)
-                        if vectorstore:
-                            st.session_state.vectorstore = vectorstore
-                            st.session_state.retriever = vectorstore.as_retriever()
-                            st.sidebar.success("Vectorstore created!")
+            # Queueing the files for the background worker instead of processing inline
+            queue = get_job_queue()
+            for file in uploaded_files:
+                queue.enqueue(file.name, file.getvalue(), tenant)
+            st.sidebar.success(f"Queued {len(uploaded_files)} documents for processing")
+    
+    with st.sidebar:
+        job_status()
     
     # Displaying processed documents
     if st.session_state.processed_docs:
@@ -55,9 +110,15 @@ def sidebar():
                     st.write("Issue Date:", doc["structured_data"]["metadata"]["issue_date"])
                 if "due_date" in doc["structured_data"]["metadata"]:
                     st.write("Due Date:", doc["structured_data"]["metadata"]["due_date"])
+                # Images are only read from the asset store when asked for
+                images = doc.get("images") or {}
+                if images and st.checkbox(f"Show {len(images)} images", key=f"show_images_{i}"):
+                    for name, ref in images.items():
+                        st.image(asset_path(ref), caption=name)
 
 def clear_chat_history():
-    """Clear the chat history in session state"""
+    """Start a new conversation, leaving the old one in the checkpointer"""
+    st.session_state.conversation_id = new_conversation_id()
     st.session_state.messages = []
     st.rerun()
 
@@ -74,7 +135,7 @@ def main_content():
         col1, col2 = st.columns([5, 1])
         with col1:
             # Show status based on whether documents are loaded
-            if st.session_state.vectorstore is not None or check_vectorstore_exists():
+            if st.session_state.vectorstore is not None or check_vectorstore_exists(current_tenant()):
                 st.success("Ready to answer questions about your documents!")
             else:
                 st.info("No documents loaded yet. You can still chat, but I won't be able to reference specific document content.")
@@ -99,17 +160,24 @@ def main_content():
             user_input = st.chat_input("Ask a question...")
             if user_input:
                 # Add user message to state
-                st.session_state.messages.append(HumanMessage(user_input))
+                message = HumanMessage(user_input)
+                st.session_state.messages.append(message)
                 
                 # Process with RAG agent
                 with st.status("Thinking...") as status:
                     try:
-                        # Create a new config dictionary for each invocation with a unique thread_id
-                        config = {"configurable": {"thread_id": f"thread_{len(st.session_state.messages)}"}}
+                        # The conversation ID keys the checkpointed history,
+                        # and this session's retriever is injected into the graph
+                        config = {"configurable": {
+                            "thread_id": st.session_state.conversation_id,
+                            "retriever": st.session_state.retriever,
+                            "vectorstore": st.session_state.vectorstore,
+                            "tenant": current_tenant(),
+                        }}
                         
-                        # Process the message
+                        # Sending only the new message, the checkpointer holds the rest
                         response = st.session_state.graph.invoke(
-                            {"messages": st.session_state.messages},
+                            {"messages": [message]},
                             config=config
                         )
                         st.session_state.messages = response["messages"]
@@ -0,0 +1,162 @@
+import re
+from typing import List, Tuple
+import numpy as np
+import tiktoken
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableConfig
+from nodes.config import get_embeddings
+from nodes.state import GraphState
+from processors.dedup import chunk_sources
+from utils.graph_tracer import graph_tracer
+
+# Units always kept, even when they score below the relative threshold
+MIN_UNITS = 3
+# Keep units scoring at least this fraction of the best unit's similarity
+RELATIVE_THRESHOLD = 0.85
+# Token budget for the rendered context
+MAX_CONTEXT_TOKENS = 1500
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+TABLE_SEPARATOR = re.compile(r"^\|?[\s:|-]+\|?$")
+MARKDOWN_IMAGE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+# Headings, quotes and bullets at the start of a line
+LEADING_MARKERS = re.compile(r"^(?:[#>]+\s*|[-*+]\s+)+")
+# Bold, italic and code delimiters around text; lone "_" and "*" inside words such as INV_2025 are kept
+EMPHASIS = re.compile(r"(\*\*|__|\*|`)(?=\S)(.+?)(?<=\S)\1")
+
+encoding = tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(text: str) -> int:
+    """Count tokens the way the chat model does."""
+    return len(encoding.encode(text))
+
+def clean_line(line: str) -> str:
+    """Strip markdown markup from a line of text without touching the words themselves."""
+    line = LEADING_MARKERS.sub("", MARKDOWN_IMAGE.sub("", line))
+    return EMPHASIS.sub(r"\2", line)
+
+def split_units(document: Document) -> List[Tuple[str, str]]:
+    """
+    Split a chunk into scorable units.
+
+    Returns (unit, header) pairs: table rows carry the header row of their
+    table so a selected row still renders with its column names, sentences
+    carry an empty header. A row is a header only when a separator row
+    follows it, so a chunk that starts mid-table keeps its first data row.
+    """
+    units = []
+    header = ""
+    lines = [line.strip() for line in document.page_content.splitlines()]
+    for i, line in enumerate(lines):
+        if not line:
+            header = ""
+            continue
+
+        if line.startswith("|"):
+            if TABLE_SEPARATOR.match(line):
+                continue
+            if i + 1 < len(lines) and lines[i + 1].startswith("|") and TABLE_SEPARATOR.match(lines[i + 1]):
+                header = line
+            else:
+                units.append((line, header))
+            continue
+
+        header = ""
+        for sentence in SENTENCE_SPLIT.split(clean_line(line)):
+            sentence = sentence.strip()
+            if len(sentence) > 2:
+                units.append((sentence, ""))
+    return units
+
+def select_units(question: str, units: List[Tuple[int, str, str]], embeddings) -> List[int]:
+    """Pick the indices of units most similar to the question within the token budget."""
+    if not units:
+        return []
+
+    # One batched embedding call for all units, normalized for cosine similarity
+    vectors = np.asarray(embeddings.embed_documents([unit for _, unit, _ in units]), dtype=np.float32)
+    query = np.asarray(embeddings.embed_query(question), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    query /= np.linalg.norm(query) + 1e-12
+    scores = vectors @ query
+
+    order = np.argsort(-scores)
+    cutoff = scores[order[0]] * RELATIVE_THRESHOLD
+
+    selected = []
+    rendered_headers = set()
+    budget = MAX_CONTEXT_TOKENS
+    for rank, index in enumerate(order):
+        if rank >= MIN_UNITS and scores[index] < cutoff:
+            break
+        doc_index, unit, header = units[index]
+        cost = count_tokens(unit)
+        # A table's header is rendered once with its first selected row
+        if header and (doc_index, header) not in rendered_headers:
+            cost += count_tokens(header)
+        if cost > budget:
+            continue
+        budget -= cost
+        if header:
+            rendered_headers.add((doc_index, header))
+        selected.append(int(index))
+    return sorted(selected)
+
+def render_context(units: List[Tuple[int, str, str]], selected: List[int], documents: List[Document]) -> str:
+    """Render selected units grouped by source, in their original order."""
+    sections = []
+    current_doc = None
+    current_header = None
+    lines = []
+    for index in selected:
+        doc_index, unit, header = units[index]
+        if doc_index != current_doc:
+            if lines:
+                sections.append("\n".join(lines))
+            # Chunks collapsed from near-duplicates name every document they came from
+            sources = chunk_sources(documents[doc_index].metadata) or ["unknown"]
+            lines = [f"Source: {', '.join(sources)}"]
+            current_doc = doc_index
+            current_header = None
+        if header and header != current_header:
+            lines.append(header)
+        current_header = header or None
+        lines.append(unit)
+    if lines:
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
+
+def compress_documents(question: str, documents: List[Document], embeddings) -> str:
+    """Extract the sentences and table rows relevant to the question as clean context."""
+    units = []
+    for doc_index, document in enumerate(documents):
+        units.extend((doc_index, unit, header) for unit, header in split_units(document))
+
+    selected = select_units(question, units, embeddings)
+    if not selected:
+        # Nothing fit the budget, falling back to the raw chunk text
+        return "\n\n".join(document.page_content for document in documents)
+    return render_context(units, selected, documents)
+
+def compress(state: GraphState, config: RunnableConfig) -> GraphState:
+    """Compress the graded documents into the context used for generation and grading"""
+
+    graph_tracer.add_trace("compress", state)
+
+    question = state["question"]
+    documents = state["documents"]
+
+    # Passing the placeholder document through untouched
+    if len(documents) == 1 and documents[0].metadata.get("source") == "system_message":
+        context = documents[0].page_content
+        graph_tracer.add_trace("compress", state, decision="Placeholder document, nothing to compress")
+        return {"context": context}
+
+    context = compress_documents(question, documents, get_embeddings(config))
+
+    raw_tokens = count_tokens(str(documents))
+    context_tokens = count_tokens(context)
+    graph_tracer.add_trace("compress", state,
+                           decision=f"Compressed {len(documents)} docs from {raw_tokens} to {context_tokens} tokens")
+
+    return {"context": context}
@@ -0,0 +1,52 @@
+from typing import Any, Optional
+from langchain_core.runnables import RunnableConfig
+from utils.llm import create_chat_model
+from processors.document_processor import DEFAULT_TENANT
+from processors.embedding_dispatcher import BatchingEmbeddings
+
+CHAT_DEPLOYMENT = "gpt-4-2"
+
+# Global default chat model, shared by callers that don't inject their own
+default_llm = None
+
+def get_configurable(config: Optional[RunnableConfig], key: str, default: Any = None) -> Any:
+    """Read a value injected by the caller through the graph config."""
+    if not config:
+        return default
+    return config.get("configurable", {}).get(key, default)
+
+def get_retriever(config: Optional[RunnableConfig]):
+    """Get the retriever injected for this run, or None if no documents are loaded."""
+    return get_configurable(config, "retriever")
+
+def get_vectorstore(config: Optional[RunnableConfig]):
+    """Get the vectorstore injected for this run, or None if no documents are loaded."""
+    return get_configurable(config, "vectorstore")
+
+def get_tenant(config: Optional[RunnableConfig]) -> str:
+    """Get the tenant whose documents this run works on."""
+    return get_configurable(config, "tenant") or DEFAULT_TENANT
+
+def get_embeddings(config: Optional[RunnableConfig]):
+    """Get the embedding model injected for this run, falling back to the vectorstore's own."""
+    embeddings = get_configurable(config, "embeddings")
+    if embeddings is not None:
+        return embeddings
+
+    vectorstore = get_vectorstore(config)
+    if vectorstore is None:
+        return None
+    # Query-time document embedding goes ahead of queued ingestion
+    embeddings = vectorstore.embeddings
+    return embeddings.for_queries() if isinstance(embeddings, BatchingEmbeddings) else embeddings
+
+def get_llm(config: Optional[RunnableConfig]):
+    """Get the chat model injected for this run, falling back to the shared default."""
+    llm = get_configurable(config, "llm")
+    if llm is not None:
+        return llm
+
+    global default_llm
+    if default_llm is None:
+        default_llm = create_chat_model(CHAT_DEPLOYMENT)
+    return default_llm
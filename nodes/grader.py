@@ -1,12 +1,30 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import wait, FIRST_COMPLETED
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import AzureChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableConfig
+from nodes.reranker import get_reranker
+from utils.llm import create_chat_model, get_encoding
+from nodes.response_cache import CachedChain, RESPONSE_CACHE_SIZE, get_response_cache, prompt_version
 from nodes.state import GraphState
 from utils.graph_tracer import graph_tracer
 
+def verdict_logit_bias(encoding) -> dict:
+    """Logit bias restricting a single-token completion to 'yes' or 'no', in the model's own token ids."""
+    words = ("yes", "no", "Yes", "No")
+    return {str(token): 100 for word in words for token in encoding.encode(word)}
+
+def parse_verdict(message) -> bool:
+    """Read a yes/no grader response."""
+    return message.content.strip().lower() == "yes"
+
 def initialize_graders():
     """Initialize grader chains for document relevance, hallucination checking, and answer quality."""
-    llm = AzureChatOpenAI(deployment_name="gpt-4-2")
+    llm = create_chat_model("gpt-4-2")
+    # Binary graders only ever need a single constrained token
+    verdict_llm = llm.bind(max_tokens=1, temperature=0, logit_bias=verdict_logit_bias(get_encoding(llm.deployment_name)))
     
     # Retrieval grader
     retrieval_grader_prompt = ChatPromptTemplate.from_messages([
@@ -17,7 +35,7 @@ def initialize_graders():
             give the answer in single word 'yes' or 'no'"""),
         ("human", "Retrieved document: \n\n {document} \n\n User question: {question}"),
     ])
-    retrieval_grader = retrieval_grader_prompt | llm
+    retrieval_grader = retrieval_grader_prompt | verdict_llm
     
     # Question rewriter
     question_rewriter_prompt = ChatPromptTemplate.from_messages([
@@ -35,7 +53,7 @@ def initialize_graders():
              give the answer in single word 'yes' or 'no'"""),
         ("human", "Set of facts: \n\n {documents} \n\n LLM generation: {generation}"),
     ])
-    hallucination_grader = hallucination_prompt | llm
+    hallucination_grader = hallucination_prompt | verdict_llm
     
     # Answer grader
     answer_prompt = ChatPromptTemplate.from_messages([
@@ -44,13 +62,22 @@ def initialize_graders():
              give the answer in single word 'yes' or 'no'"""),
         ("human", "User question: \n\n {question} \n\n LLM generation: {generation}"),
     ])
-    answer_grader = answer_prompt | llm
+    answer_grader = answer_prompt | verdict_llm
+    
+    chains = {
+        "retrieval_grader": (retrieval_grader, retrieval_grader_prompt, verdict_llm.kwargs),
+        "question_rewriter": (question_rewriter, question_rewriter_prompt, {}),
+        "hallucination_grader": (hallucination_grader, hallucination_prompt, verdict_llm.kwargs),
+        "answer_grader": (answer_grader, answer_prompt, verdict_llm.kwargs),
+    }
+    if RESPONSE_CACHE_SIZE <= 0:
+        return {name: chain for name, (chain, _, _) in chains.items()}
     
+    # Answering repeated calls from the persistent response cache
+    cache = get_response_cache()
     return {
-        "retrieval_grader": retrieval_grader,
-        "question_rewriter": question_rewriter,
-        "hallucination_grader": hallucination_grader,
-        "answer_grader": answer_grader
+        name: CachedChain(name, chain, prompt_version(prompt, {"deployment": llm.deployment_name, **settings}), cache)
+        for name, (chain, prompt, settings) in chains.items()
     }
 
 # Global graders
@@ -63,7 +90,28 @@ def get_graders():
         graders = initialize_graders()
     return graders
 
-def grade_documents(state: GraphState) -> GraphState:
+# Background event loop for speculative grader calls, so a call that is no
+# longer needed can be cancelled mid-flight instead of awaited
+grader_loop = None
+grader_loop_lock = threading.Lock()
+
+def get_grader_loop():
+    """Get or start the background grader event loop."""
+    global grader_loop
+    with grader_loop_lock:
+        if grader_loop is None:
+            grader_loop = asyncio.new_event_loop()
+            threading.Thread(target=grader_loop.run_forever, daemon=True, name="grader-loop").start()
+    return grader_loop
+
+async def timed_verdict(grader, inputs, timings, name):
+    """Run a grader, recording how long it took once it completes."""
+    start = time.perf_counter()
+    verdict = parse_verdict(await grader.ainvoke(inputs))
+    timings[name] = time.perf_counter() - start
+    return verdict
+
+def grade_documents(state: GraphState, config: RunnableConfig) -> GraphState:
     """Determines whether the retrieved documents are relevant to the question."""
 
     graph_tracer.add_trace("grade_documents", state)
@@ -71,26 +119,42 @@ def grade_documents(state: GraphState) -> GraphState:
     question = state["question"]
     documents = state["documents"]
     
-    # Get graders
-    graders = get_graders()
-    retrieval_grader = graders["retrieval_grader"]
-
-    # Scoring each doc
-    filtered_docs = []
-    for i, d in enumerate(documents):
-        score = retrieval_grader.invoke(
-            {"question": question, "document": d.page_content}
+    # Passing the placeholder document (or nothing) straight through
+    if not documents or documents[0].metadata.get("source") == "system_message":
+        return {"documents": documents, "question": question}
+    
+    # Reranking the over-fetched candidates locally
+    reranker = get_reranker()
+    start = time.perf_counter()
+    ranked = reranker.rerank(question, documents, config)
+    timings = {"rerank": time.perf_counter() - start}
+    
+    # Keeping confident matches, dropping clear misses, and only asking the
+    # LLM grader about the borderline scores in between
+    verdicts = {}
+    borderline = [doc for doc, score in ranked if reranker.drop_threshold <= score < reranker.keep_threshold]
+    if borderline:
+        retrieval_grader = get_graders()["retrieval_grader"]
+        start = time.perf_counter()
+        scores = retrieval_grader.batch(
+            [{"question": question, "document": d.page_content} for d in borderline]
         )
-        grade = score.content
-        if grade == "yes":
-            filtered_docs.append(d)
+        timings["llm_fallback"] = time.perf_counter() - start
+        verdicts = {id(d): parse_verdict(score) for d, score in zip(borderline, scores)}
+    
+    filtered_docs = [
+        doc for doc, score in ranked
+        if score >= reranker.keep_threshold or verdicts.get(id(doc), False)
+    ]
     
     # Creating updated state        
     updated_state = {"documents": filtered_docs, "question": question}
     
     # Adding trace with filtering results
     graph_tracer.add_trace("grade_documents", updated_state, 
-                          decision=f"Filtered {len(documents)} docs to {len(filtered_docs)} relevant docs")
+                          decision=(f"Reranked {len(documents)} candidates with {reranker.name}, kept "
+                                    f"{len(filtered_docs)} of top {len(ranked)} ({len(borderline)} graded by LLM)"),
+                          timings=timings)
     
     return updated_state
 
@@ -152,28 +216,46 @@ def grade_generation_v_documents_and_question(state: GraphState) -> str:
     hallucination_grader = graders["hallucination_grader"]
     answer_grader = graders["answer_grader"]
 
-    # Checking hallucination
-    score = hallucination_grader.invoke(
-        {"documents": documents, "generation": generation}
+    # Running both graders speculatively; a hallucination verdict of 'no'
+    # decides the route on its own, so the answer grader is cancelled then
+    loop = get_grader_loop()
+    timings = {}
+    hallucination = asyncio.run_coroutine_threadsafe(
+        timed_verdict(hallucination_grader, {"documents": state.get("context") or documents, "generation": generation},
+                      timings, "hallucination"),
+        loop,
     )
-    grade = score.content
+    answer = asyncio.run_coroutine_threadsafe(
+        timed_verdict(answer_grader, {"question": question, "generation": generation}, timings, "answer"),
+        loop,
+    )
+
+    pending = {hallucination, answer}
+    while pending:
+        _, pending = wait(pending, return_when=FIRST_COMPLETED)
+        if hallucination.done() and not hallucination.result():
+            for future in pending:
+                future.cancel()
+            break
+
+    grounded = hallucination.result()
+    timings = dict(timings)
     decision = None
 
-    if grade == "yes":
-        # Checking question-answering
-        score = answer_grader.invoke({"question": question, "generation": generation})
-        grade = score.content
-        if grade == "yes":
+    if grounded:
+        if answer.result():
             decision = "useful"
-            graph_tracer.add_trace("grade_generation", state, 
-                                  decision="Generation is grounded and answers question")
+            summary = "Generation is grounded and answers question"
         else:
             decision = "not useful"
-            graph_tracer.add_trace("grade_generation", state, 
-                                  decision="Generation is grounded but doesn't answer question")
+            summary = "Generation is grounded but doesn't answer question"
     else:
         decision = "not supported"
-        graph_tracer.add_trace("grade_generation", state, 
-                              decision="Generation contains hallucinations")
+        summary = "Generation contains hallucinations"
+
+    timing_summary = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+    if "answer" not in timings:
+        timing_summary += ", answer cancelled"
+    graph_tracer.add_trace("grade_generation", state, decision=f"{summary} ({timing_summary})", timings=timings)
 
     return decision 
\ No newline at end of file
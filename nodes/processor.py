@@ -1,12 +1,22 @@
-import streamlit as st
-from langchain_openai import AzureChatOpenAI
 from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
 from langchain import hub
+from nodes.config import get_llm, get_retriever
 from nodes.state import GraphState
 from utils.graph_tracer import graph_tracer
 from langchain_core.documents import Document
 
-def retrieve(state: GraphState) -> GraphState:
+# Global RAG prompt, pulled from the hub once per process
+rag_prompt = None
+
+def get_rag_prompt():
+    """Get or pull the RAG prompt."""
+    global rag_prompt
+    if rag_prompt is None:
+        rag_prompt = hub.pull("rlm/rag-prompt")
+    return rag_prompt
+
+def retrieve(state: GraphState, config: RunnableConfig) -> GraphState:
     """Retrieve documents"""
 
     graph_tracer.add_trace("retrieve", state)
@@ -14,15 +24,16 @@ def retrieve(state: GraphState) -> GraphState:
     recent_message = state["messages"][-1]
     question = recent_message.content
     
-    # Retrieval using the vectorstore retriever
-    if st.session_state.retriever:
-        documents = st.session_state.retriever.invoke(question)
-        updated_state = {**state, "documents": documents, "question": question}
+    # Retrieval using the retriever injected through the graph config
+    retriever = get_retriever(config)
+    if retriever:
+        documents = retriever.invoke(question)
+        update = {"documents": documents, "question": question}
         
         # Adding trace after retrieval with document count
-        graph_tracer.add_trace("retrieve", updated_state, 
+        graph_tracer.add_trace("retrieve", {**state, **update}, 
                                decision=f"Retrieved {len(documents)} documents")
-        return updated_state
+        return update
     else:
         # No retriever available, creating a special document to explain the situation
         placeholder_doc = Document(
@@ -31,16 +42,16 @@ def retrieve(state: GraphState) -> GraphState:
             metadata={"source": "system_message"}
         )
         
-        updated_state = {**state, "documents": [placeholder_doc], "question": question}
-        graph_tracer.add_trace("retrieve", updated_state, decision="No retriever available, using placeholder")
-        return updated_state
+        update = {"documents": [placeholder_doc], "question": question}
+        graph_tracer.add_trace("retrieve", {**state, **update}, decision="No retriever available, using placeholder")
+        return update
 
-def generate(state: GraphState) -> GraphState:
+def generate(state: GraphState, config: RunnableConfig) -> GraphState:
     """Generate answer"""
 
     graph_tracer.add_trace("generate", state)
     
-    llm = AzureChatOpenAI(deployment_name="gpt-4-2")
+    llm = get_llm(config)
     question = state["question"]
     documents = state["documents"]
     
@@ -54,50 +65,42 @@ def generate(state: GraphState) -> GraphState:
         messages = state["messages"]
         ai_message = llm.invoke(messages)
         
-        updated_state = {
-            **state, 
-            "documents": documents, 
-            "question": question, 
+        update = {
             "generation": ai_message.content, 
-            "messages": state["messages"] + [ai_message],
+            "messages": [ai_message],
         }
     else:
         # Normal RAG generation (with documents)
-        prompt = hub.pull("rlm/rag-prompt")
-        formatted_prompt = prompt.format(context=documents, question=question)
+        prompt = get_rag_prompt()
+        formatted_prompt = prompt.format(context=state.get("context") or documents, question=question)
         
-        messages = state["messages"] + [HumanMessage(formatted_prompt)]
-        ai_message = llm.invoke(messages)
+        prompt_message = HumanMessage(formatted_prompt)
+        ai_message = llm.invoke(state["messages"] + [prompt_message])
         
-        updated_state = {
-            **state, 
-            "documents": documents, 
-            "question": question, 
+        # add_messages appends these to the thread's history
+        update = {
             "generation": ai_message.content, 
-            "messages": messages + [ai_message],
+            "messages": [prompt_message, ai_message],
         }
     
     # Adding trace after generation
-    graph_tracer.add_trace("generate", updated_state, 
+    graph_tracer.add_trace("generate", {**state, **update}, 
                            decision="Generated response" + (" (without documents)" if is_placeholder else ""))
     
-    return updated_state
+    return update
 
-def responder(state: GraphState):
+def responder(state: GraphState, config: RunnableConfig):
     """Respond to the user with a standard LLM response"""
 
     graph_tracer.add_trace("responder", state)
     
-    llm = AzureChatOpenAI(deployment_name="gpt-4-2")
+    llm = get_llm(config)
     response = llm.invoke(state["messages"])
     
-    updated_state = {
-        **state,
-        "messages": state["messages"] + [response]
-    }
+    update = {"messages": [response]}
     
     # Adding trace after responding
-    graph_tracer.add_trace("responder", updated_state, 
+    graph_tracer.add_trace("responder", {**state, **update}, 
                            decision="Direct response")
     
-    return updated_state 
\ No newline at end of file
+    return update 
\ No newline at end of file
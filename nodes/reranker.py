@@ -0,0 +1,120 @@
+import os
+import threading
+from typing import List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableConfig
+from nodes.config import get_embeddings, get_vectorstore
+
+# Documents kept after reranking the over-fetched candidates
+TOP_N = 4
+RERANK_BATCH_SIZE = 32
+CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+class CrossEncoderReranker:
+    """
+    Scores (question, chunk) pairs with a small cross-encoder on CPU.
+
+    The ms-marco models output raw logits (about -11 to +11); a sigmoid maps
+    them to relevance probabilities in [0, 1] before the thresholds apply.
+    """
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str = CROSS_ENCODER_MODEL, keep_threshold: float = 0.5,
+                 drop_threshold: float = 0.05, batch_size: int = RERANK_BATCH_SIZE):
+        """Load the cross-encoder model"""
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.keep_threshold = keep_threshold
+        self.drop_threshold = drop_threshold
+        self.batch_size = batch_size
+
+    def rerank(self, question: str, documents: List[Document], config: Optional[RunnableConfig]) -> List[Tuple[Document, float]]:
+        """Score every candidate in batches and return the best, highest first"""
+        logits = np.asarray(self.model.predict(
+            [(question, doc.page_content) for doc in documents],
+            batch_size=self.batch_size,
+            show_progress_bar=False,
+        ), dtype=np.float64)
+        scores = 1 / (1 + np.exp(-logits))
+        ranked = sorted(zip(documents, (float(score) for score in scores)), key=lambda pair: -pair[1])
+        return ranked[:TOP_N]
+
+class EmbeddingMMRReranker:
+    """
+    Reranks with the embeddings already stored in the vectorstore.
+
+    Relevance is the cosine similarity between the question and each chunk;
+    selection uses maximal marginal relevance so near-identical chunks don't
+    crowd out the rest. Only the question needs embedding.
+    """
+    name = "mmr"
+
+    def __init__(self, keep_threshold: float = 0.6, drop_threshold: float = 0.3, lambda_mult: float = 0.7):
+        """Configure score thresholds and the relevance/diversity trade-off"""
+        self.keep_threshold = keep_threshold
+        self.drop_threshold = drop_threshold
+        self.lambda_mult = lambda_mult
+
+    def _document_vectors(self, documents: List[Document], config: Optional[RunnableConfig]) -> np.ndarray:
+        """Look up stored embeddings by id, embedding only chunks without one"""
+        vectorstore = get_vectorstore(config)
+        ids = [doc.id for doc in documents if getattr(doc, "id", None)]
+        stored = {}
+        if vectorstore is not None and ids:
+            result = vectorstore.get(ids=ids, include=["embeddings"])
+            stored = dict(zip(result["ids"], result["embeddings"]))
+
+        vectors = [stored.get(getattr(doc, "id", None)) for doc in documents]
+        missing = [index for index, vector in enumerate(vectors) if vector is None]
+        if missing:
+            embedded = get_embeddings(config).embed_documents([documents[index].page_content for index in missing])
+            for index, vector in zip(missing, embedded):
+                vectors[index] = vector
+
+        return np.asarray(vectors, dtype=np.float32)
+
+    def rerank(self, question: str, documents: List[Document], config: Optional[RunnableConfig]) -> List[Tuple[Document, float]]:
+        """Score candidates by cosine similarity and select the top ones with MMR"""
+        vectors = self._document_vectors(documents, config)
+        query = np.asarray(get_embeddings(config).embed_query(question), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        query /= np.linalg.norm(query) + 1e-12
+
+        scores = vectors @ query
+        similarity = vectors @ vectors.T
+
+        selected = [int(np.argmax(scores))]
+        while len(selected) < min(TOP_N, len(documents)):
+            redundancy = similarity[:, selected].max(axis=1)
+            mmr = self.lambda_mult * scores - (1 - self.lambda_mult) * redundancy
+            mmr[selected] = -np.inf
+            selected.append(int(np.argmax(mmr)))
+
+        return [(documents[index], float(scores[index])) for index in selected]
+
+def create_reranker():
+    """Create the reranker named by RERANKER, preferring the cross-encoder when installed."""
+    choice = os.environ.get("RERANKER", "").lower()
+    if choice == EmbeddingMMRReranker.name:
+        return EmbeddingMMRReranker()
+
+    try:
+        return CrossEncoderReranker()
+    except ImportError:
+        if choice == CrossEncoderReranker.name:
+            raise
+        return EmbeddingMMRReranker()
+
+# Global reranker
+reranker = None
+reranker_lock = threading.Lock()
+
+def get_reranker():
+    """Get or initialize the reranker."""
+    global reranker
+    with reranker_lock:
+        if reranker is None:
+            reranker = create_reranker()
+    return reranker
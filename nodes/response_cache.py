@@ -0,0 +1,167 @@
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Dict, List
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+
+RESPONSE_CACHE_DATABASE = os.path.join(os.getcwd(), "llm_cache.db")
+# Entries kept before the least recently used are evicted; 0 disables the cache
+RESPONSE_CACHE_SIZE = int(os.environ.get("LLM_CACHE_SIZE", "10000"))
+
+def normalize_input(value: Any) -> Any:
+    """Canonical form of a chain input, so formatting noise doesn't miss the cache"""
+    if isinstance(value, Document):
+        value = value.page_content
+    if isinstance(value, str):
+        return re.sub(r"\s+", " ", value).strip()
+    if isinstance(value, (list, tuple)):
+        return [normalize_input(item) for item in value]
+    if isinstance(value, dict):
+        return {key: normalize_input(item) for key, item in value.items()}
+    return value
+
+def prompt_version(prompt, settings: Dict[str, Any]) -> str:
+    """Short hash of a prompt's templates and model settings; editing either starts a new version"""
+    templates = [getattr(getattr(message, "prompt", None), "template", repr(message)) for message in prompt.messages]
+    payload = json.dumps({"templates": templates, "settings": settings}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:12]
+
+class ResponseCache:
+    """
+    Persistent exact-match cache of LLM chain responses in SQLite.
+
+    Keys hash the chain name, its prompt version and the normalized inputs.
+    Lookups refresh an entry's last use, and inserts beyond max_entries evict
+    the least recently used entries. Hits and misses are counted per chain.
+    """
+    def __init__(self, path: str = RESPONSE_CACHE_DATABASE, max_entries: int = RESPONSE_CACHE_SIZE):
+        """Open the cache database, creating the responses table if needed"""
+        self.path = path
+        self.max_entries = max_entries
+        self.metrics: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                chain TEXT NOT NULL,
+                response TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    @staticmethod
+    def key(chain: str, version: str, inputs: Dict[str, Any]) -> str:
+        """Cache key of one chain call"""
+        payload = json.dumps({"chain": chain, "version": version, "inputs": normalize_input(inputs)},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _count(self, chain: str, outcome: str):
+        """Record a hit or a miss"""
+        counts = self.metrics.setdefault(chain, {"hits": 0, "misses": 0})
+        counts[outcome] += 1
+
+    def get(self, chain: str, key: str):
+        """Cached response for a key, or None on a miss"""
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count(chain, "misses")
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._count(chain, "hits")
+        data = json.loads(row[0])
+        return AIMessage(data["content"]) if data["type"] == "message" else data["content"]
+
+    def put(self, chain: str, key: str, response):
+        """Store a response, evicting the least recently used entries beyond the bound"""
+        if isinstance(response, AIMessage):
+            data = {"type": "message", "content": response.content}
+        else:
+            data = {"type": "text", "content": response}
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, chain, response, last_used) VALUES (?, ?, ?, ?)",
+                (key, chain, json.dumps(data), time.time()),
+            )
+            excess = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit metrics per chain and the number of stored entries"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            chains = {
+                chain: {**counts, "hit_rate": counts["hits"] / max(1, counts["hits"] + counts["misses"])}
+                for chain, counts in self.metrics.items()
+            }
+        return {"entries": entries, "max_entries": self.max_entries, "chains": chains}
+
+class CachedChain:
+    """
+    Wraps a deterministic chain so identical calls are answered from the cache.
+
+    Supports the invoke, ainvoke and batch calls the graph nodes make; a
+    batch only sends its misses to the model.
+    """
+    def __init__(self, name: str, chain, version: str, cache: ResponseCache):
+        """Wrap a chain under a name and prompt version"""
+        self.name = name
+        self.chain = chain
+        self.version = version
+        self.cache = cache
+
+    def _key(self, inputs: Dict[str, Any]) -> str:
+        """Cache key of one call"""
+        return self.cache.key(self.name, self.version, inputs)
+
+    def invoke(self, inputs: Dict[str, Any], config=None):
+        """Run the chain unless the response is cached"""
+        key = self._key(inputs)
+        response = self.cache.get(self.name, key)
+        if response is None:
+            response = self.chain.invoke(inputs, config)
+            self.cache.put(self.name, key, response)
+        return response
+
+    async def ainvoke(self, inputs: Dict[str, Any], config=None):
+        """Run the chain asynchronously unless the response is cached"""
+        key = self._key(inputs)
+        response = self.cache.get(self.name, key)
+        if response is None:
+            response = await self.chain.ainvoke(inputs, config)
+            self.cache.put(self.name, key, response)
+        return response
+
+    def batch(self, inputs: List[Dict[str, Any]], config=None) -> List[Any]:
+        """Run the chain on the uncached inputs only, in one batch"""
+        keys = [self._key(item) for item in inputs]
+        responses = [self.cache.get(self.name, key) for key in keys]
+        misses = [i for i, response in enumerate(responses) if response is None]
+        if misses:
+            for i, response in zip(misses, self.chain.batch([inputs[i] for i in misses], config)):
+                self.cache.put(self.name, keys[i], response)
+                responses[i] = response
+        return responses
+
+# Global response cache
+response_cache = None
+
+def get_response_cache() -> ResponseCache:
+    """Get or open the response cache."""
+    global response_cache
+    if response_cache is None:
+        response_cache = ResponseCache()
+    return response_cache
@@ -1,22 +1,22 @@
 from langchain_core.messages import SystemMessage
-from langchain_openai import AzureChatOpenAI
-from langgraph.prebuilt import tools_condition
+from langchain_core.runnables import RunnableConfig
+from nodes.config import get_llm, get_vectorstore
 from nodes.state import GraphState
 from utils.graph_tracer import graph_tracer
-import streamlit as st
 
-def chat_router(state: GraphState) -> GraphState:
+def chat_router(state: GraphState, config: RunnableConfig) -> GraphState:
     """Chat router function to process the state and return a response."""
 
     graph_tracer.add_trace("chat", state)
     
-    llm = AzureChatOpenAI(deployment_name="gpt-4-2")
+    llm = get_llm(config)
+    has_documents = get_vectorstore(config) is not None
     
     base_prompt = """You are the Intelligent Document Assistant. You will be given the entire chat history."""
 
     # Document context if documents are available
     doc_prompt = ""
-    if st.session_state.vectorstore is not None:
+    if has_documents:
         doc_prompt = """You have access to a database of documents that you can search through to answer questions.
         When asked about documents, use the 'retrieve' action to search them."""
     else:
@@ -37,6 +37,10 @@ def chat_router(state: GraphState) -> GraphState:
     - divides a by b
     - ensure b is not 0
 
+    def analyze_documents(aggregation, column, table, group_by, document_type, date_from, date_to, filters)
+    - sums, averages, counts, min/max and group-by breakdowns over the tables extracted from the documents
+    - use it for totals across documents (e.g. "total billed to ACME in Q1") instead of adding numbers one by one
+
     Your job is to look at the most recent user request in context and choose exactly one of three actions:
 
     1. retrieve
@@ -45,7 +49,7 @@ def chat_router(state: GraphState) -> GraphState:
     - reply with single word "retrieve"
 
     2. tool 
-    - You have enough document data, but need to run a tool.
+    - You have enough document data, but need to run a tool, or the request is an aggregate over the documents' tables.
     - reply with single word "tool".
 
     3. respond
@@ -68,18 +72,16 @@ def chat_router(state: GraphState) -> GraphState:
     
     # If retrieval is requested but no vectorstore exists, switch to respond
     final_ans = route_ans.content
-    if final_ans == "retrieve" and st.session_state.vectorstore is None:
+    if final_ans == "retrieve" and not has_documents:
         final_ans = "respond"
     
-    updated_state = {
-        **state,
-        "chat_router": final_ans,
-    }
+    update = {"chat_router": final_ans}
     
     # Adding trace for routing decision
-    graph_tracer.add_trace("chat", updated_state, decision=final_ans)
+    graph_tracer.add_trace("chat", {**state, **update}, decision=final_ans)
     
-    return updated_state
+    # Returning only the changed keys, the checkpointer merges them into the thread's state
+    return update
 
 def decide_betn_respond_retrieve_toolcall(state: GraphState) -> str:
     """Decision function to route between respond, retrieve, tool or end"""
@@ -89,9 +91,8 @@ def decide_betn_respond_retrieve_toolcall(state: GraphState) -> str:
     if route_ans == "respond":
         decision = "respond"
     elif route_ans == 'tool':
-        # For tools, finding out which specific tool
-        tool_decision = tools_condition(state)
-        decision = f"tool:{tool_decision}"
+        # call_tools picks the tools themselves
+        decision = "tools"
     elif route_ans == 'retrieve':
         decision = "retrieve"
     elif route_ans == "end":
@@ -102,4 +103,4 @@ def decide_betn_respond_retrieve_toolcall(state: GraphState) -> str:
     # Adding trace for the router decision
     graph_tracer.add_trace("router_decision", state, decision=decision)
     
-    return decision.split(":")[0] if ":" in decision else decision 
\ No newline at end of file
+    return decision 
\ No newline at end of file
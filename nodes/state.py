@@ -11,9 +11,11 @@ class GraphState(TypedDict):
         question: Current question
         generation: LLM generation
         documents: List of retrieved documents
+        context: Compressed context rendered from the documents
     """
     messages: Annotated[list, add_messages]
     chat_router: Optional[str]
     question: Optional[str]
     generation: Optional[str]
-    documents: List[str] 
\ No newline at end of file
+    documents: List[str]
+    context: Optional[str] 
\ No newline at end of file
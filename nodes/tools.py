@@ -1,4 +1,11 @@
+from typing import Dict, List, Optional
+from langchain_core.messages import SystemMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.prebuilt import ToolNode
+from nodes.config import get_llm, get_tenant
+from nodes.state import GraphState
+from processors.analytics import get_analytics
+from utils.graph_tracer import graph_tracer
 
 def multiply(a: float, b: float) -> float:
     """Multiply a and b."""
@@ -12,6 +19,45 @@ def divide(a: float, b: float) -> float:
     """Divide a by b."""
     return a / b
 
-tools = [multiply, add, divide]
+def analyze_documents(aggregation: str = "sum", column: Optional[str] = None, table: str = "rows",
+                      group_by: Optional[List[str]] = None, document_type: Optional[str] = None,
+                      date_from: Optional[str] = None, date_to: Optional[str] = None,
+                      filters: Optional[Dict[str, str]] = None, config: RunnableConfig = None) -> str:
+    """Aggregate the structured data extracted from the documents in one call.
 
-tools_node = ToolNode(tools) 
\ No newline at end of file
+    aggregation: one of sum, mean, min, max, count.
+    column: numeric column to aggregate (not needed for count).
+    table: "rows" (one row per line of every extracted table, e.g. invoice line
+        items) or "documents" (one row per document, e.g. invoice totals).
+    group_by: columns to group by, e.g. ["document_bill_to_name"] or ["issue_quarter"].
+    document_type: only documents of this type, e.g. "INVOICE".
+    date_from, date_to: inclusive issue date range, e.g. "1 January 2025".
+    filters: column -> value; text columns match case-insensitive substrings.
+    """
+    return get_analytics(get_tenant(config)).query(
+        aggregation, column, table, group_by, document_type, date_from, date_to, filters
+    )
+
+tools = [multiply, add, divide, analyze_documents]
+
+tools_node = ToolNode(tools)
+
+def call_tools(state: GraphState, config: RunnableConfig) -> GraphState:
+    """Let the chat model issue tool calls for the most recent request"""
+
+    graph_tracer.add_trace("call_tools", state)
+
+    llm = get_llm(config).bind_tools(tools)
+    schema = get_analytics(get_tenant(config)).describe()
+    sysmsg = SystemMessage(
+        "Call the tools needed to answer the most recent request. For totals, counts, averages or "
+        "breakdowns over the documents, use a single analyze_documents call instead of chaining "
+        f"arithmetic tools. The structured data available to analyze_documents is:\n{schema}"
+    )
+    response = llm.invoke([sysmsg] + state["messages"])
+
+    graph_tracer.add_trace("call_tools", state,
+                           decision=f"Requested {len(response.tool_calls)} tool calls: "
+                                    f"{', '.join(call['name'] for call in response.tool_calls) or 'none'}")
+
+    return {"messages": [response]}
@@ -0,0 +1,197 @@
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+from processors.document_processor import DEFAULT_TENANT, normalize_document_type, tenant_slug
+from processors.structured_store import StructuredDataStore
+
+AGGREGATIONS = ("sum", "mean", "min", "max", "count")
+TABLES = ("rows", "documents")
+# Dates are extracted as e.g. "16 May 2025"
+DATE_FORMAT = "%d %B %Y"
+# Groups returned per query, keeping tool output small
+MAX_RESULT_ROWS = 50
+# Columns describing the document every row came from
+DOCUMENT_COLUMNS = ("filename", "document_type", "issue_date", "due_date")
+
+def column_name(path: Tuple[str, ...]) -> str:
+    """Snake-case column name for a path of JSON keys"""
+    return re.sub(r"[^a-z0-9]+", "_", "_".join(path).lower()).strip("_")
+
+def flatten_fields(value: dict, prefix: Tuple[str, ...] = ()) -> Tuple[dict, Dict[str, List[dict]]]:
+    """Split a nested JSON object into its scalar fields and its tables (lists of objects)"""
+    fields, tables = {}, {}
+    for key, item in value.items():
+        path = prefix + (str(key),)
+        if isinstance(item, dict):
+            nested_fields, nested_tables = flatten_fields(item, path)
+            fields.update(nested_fields)
+            tables.update(nested_tables)
+        elif isinstance(item, list):
+            rows = [row for row in item if isinstance(row, dict)]
+            if rows:
+                tables[column_name(path)] = rows
+        else:
+            fields[column_name(path)] = item
+    return fields, tables
+
+def parse_dates(values: pd.Series) -> pd.Series:
+    """Parse extracted dates, falling back to pandas' inference for other formats"""
+    parsed = pd.to_datetime(values, format=DATE_FORMAT, errors="coerce")
+    missing = parsed.isna() & values.notna()
+    if missing.any():
+        parsed[missing] = pd.to_datetime(values[missing], errors="coerce", format="mixed")
+    return parsed
+
+def parse_date_filter(value: str) -> pd.Timestamp:
+    """Parse a date given to a filter, rejecting what isn't a date instead of matching nothing"""
+    parsed = parse_dates(pd.Series([value], dtype=object))[0]
+    if pd.isna(parsed):
+        raise ValueError(f"Could not parse date '{value}'; use a date such as '2025-01-31' or '31 January 2025'")
+    return parsed
+
+def coerce_numbers(frame: pd.DataFrame) -> pd.DataFrame:
+    """Turn text columns holding only amounts (e.g. "$1,200.00") into numeric columns"""
+    for column in frame.columns:
+        if column in DOCUMENT_COLUMNS or frame[column].dtype != object:
+            continue
+        present = frame[column].notna()
+        numbers = pd.to_numeric(frame[column].astype(str).str.replace(r"[,$€£\s]", "", regex=True), errors="coerce")
+        if present.any() and numbers[present].notna().all():
+            frame[column] = numbers.where(present)
+    return frame
+
+def build_frames(documents: List[Tuple[str, dict]]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Build the per-document frame and the per-table-row frame from structured data"""
+    document_records, row_records = [], []
+    for filename, structured_data in documents:
+        metadata = structured_data.get("metadata") or {}
+        data = structured_data.get("data", {k: v for k, v in structured_data.items() if k != "metadata"})
+        fields, tables = flatten_fields(data if isinstance(data, dict) else {})
+        header = {
+            "filename": filename,
+            "document_type": normalize_document_type(metadata.get("document_type")),
+            "issue_date": metadata.get("issue_date"),
+            "due_date": metadata.get("due_date"),
+        }
+        fields = {key: value for key, value in fields.items() if key not in DOCUMENT_COLUMNS}
+        document_records.append({**header, **fields})
+
+        # Document fields are prefixed on table rows so they never mix with row fields of the same name
+        document_fields = {f"document_{key}": value for key, value in fields.items()}
+        for table, rows in tables.items():
+            for row in rows:
+                row_fields, _ = flatten_fields(row)
+                row_fields = {key: value for key, value in row_fields.items() if key not in DOCUMENT_COLUMNS}
+                row_records.append({**header, "table": table, **row_fields, **document_fields})
+
+    frames = []
+    for records in (document_records, row_records):
+        frame = coerce_numbers(pd.DataFrame.from_records(records))
+        if "issue_date" in frame:
+            frame["issue_date"] = parse_dates(frame["issue_date"])
+            frame["due_date"] = parse_dates(frame["due_date"])
+            # Derived periods for group-by and filters like "Q1"
+            frame["issue_year"] = frame["issue_date"].dt.year.astype("Int64")
+            frame["issue_quarter"] = frame["issue_date"].dt.to_period("Q").astype(str)
+            frame["issue_month"] = frame["issue_date"].dt.to_period("M").astype(str)
+        frames.append(frame)
+    return frames[0], frames[1]
+
+class DocumentAnalytics:
+    """
+    Columnar frames over the structured data of one tenant's documents.
+
+    "documents" has one row per document with its scalar fields (totals,
+    parties, dates); "rows" has one row per line of every extracted table
+    (line items, services), carrying its document's type and dates and its
+    other fields prefixed with "document_". A query
+    filters, groups and aggregates with vectorized pandas operations.
+    """
+    def __init__(self, documents: List[Tuple[str, dict]]):
+        """Build the frames from (filename, structured data) pairs"""
+        documents_frame, rows_frame = build_frames(documents)
+        self.frames = {"rows": rows_frame, "documents": documents_frame}
+        self.document_count = len(documents)
+
+    def describe(self) -> str:
+        """Summarize the columns of both frames for the chat model"""
+        if not self.document_count:
+            return "No structured data has been extracted from documents yet."
+        lines = []
+        for table, frame in self.frames.items():
+            columns = ", ".join(f"{column} ({frame[column].dtype})" for column in frame.columns)
+            lines.append(f'table "{table}": {len(frame)} rows; columns: {columns}')
+        types = sorted(self.frames["documents"]["document_type"].unique())
+        lines.append(f"document types: {', '.join(types)}")
+        return "\n".join(lines)
+
+    def query(self, aggregation: str = "sum", column: Optional[str] = None, table: str = "rows",
+              group_by: Optional[List[str]] = None, document_type: Optional[str] = None,
+              date_from: Optional[str] = None, date_to: Optional[str] = None,
+              filters: Optional[Dict[str, str]] = None) -> str:
+        """Aggregate a column over the filtered rows, optionally per group, formatted as text"""
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation '{aggregation}', expected one of {AGGREGATIONS}")
+        if table not in TABLES:
+            raise ValueError(f"Unknown table '{table}', expected one of {TABLES}")
+        frame = self.frames[table]
+        if frame.empty:
+            return f'The "{table}" table is empty.'
+
+        group_by = group_by or []
+        filters = filters or {}
+        unknown = [name for name in [column, *group_by, *filters] if name and name not in frame.columns]
+        if unknown:
+            raise ValueError(f"Unknown columns {unknown} in table '{table}'; available: {list(frame.columns)}")
+        if aggregation != "count":
+            if column is None:
+                raise ValueError(f"Aggregation '{aggregation}' needs a column")
+            if not pd.api.types.is_numeric_dtype(frame[column]):
+                raise ValueError(f"Column '{column}' is not numeric")
+
+        # Building one boolean mask from all filters
+        mask = pd.Series(True, index=frame.index)
+        if document_type:
+            mask &= frame["document_type"] == normalize_document_type(document_type)
+        if date_from:
+            mask &= frame["issue_date"] >= parse_date_filter(date_from)
+        if date_to:
+            mask &= frame["issue_date"] <= parse_date_filter(date_to)
+        for name, value in filters.items():
+            values = frame[name]
+            if pd.api.types.is_numeric_dtype(values):
+                mask &= values == float(value)
+            else:
+                mask &= values.astype(str).str.contains(str(value), case=False, regex=False, na=False)
+        selected = frame[mask]
+
+        label = f"{aggregation}({column})" if column else aggregation
+        scope = f"{len(selected)} {table} from {selected['filename'].nunique()} documents"
+        if not group_by:
+            value = len(selected) if aggregation == "count" else selected[column].agg(aggregation)
+            return f"{label} = {value} over {scope}"
+
+        grouped = selected.groupby(group_by, dropna=False)
+        result = grouped.size() if aggregation == "count" else grouped[column].agg(aggregation)
+        result = result.sort_values(ascending=False)
+        text = result.head(MAX_RESULT_ROWS).rename(label).to_string()
+        if len(result) > MAX_RESULT_ROWS:
+            text += f"\n... {len(result) - MAX_RESULT_ROWS} more groups"
+        return f"{label} by {', '.join(group_by)} over {scope}:\n{text}"
+
+# Analytics per tenant, rebuilt when its documents change
+analytics_cache: Dict[str, Tuple[tuple, DocumentAnalytics]] = {}
+analytics_lock = threading.Lock()
+
+def get_analytics(tenant: str = DEFAULT_TENANT) -> DocumentAnalytics:
+    """Get a tenant's analytics frames, rebuilding them if documents were added since."""
+    store = StructuredDataStore()
+    key = tenant_slug(tenant)
+    version = store.version(tenant)
+    with analytics_lock:
+        cached = analytics_cache.get(key)
+        if cached is None or cached[0] != version:
+            cached = (version, DocumentAnalytics(store.list_documents(tenant)))
+            analytics_cache[key] = cached
+        return cached[1]
@@ -0,0 +1,31 @@
+import os
+import io
+import hashlib
+import tempfile
+
+ASSET_DIRECTORY = os.path.join(os.getcwd(), "assets")
+
+def asset_path(ref):
+    """Get the file path of a stored asset from its reference."""
+    return os.path.join(ASSET_DIRECTORY, ref[:2], f"{ref}.png")
+
+def save_image(image):
+    """Store an image under the hash of its PNG bytes and return the reference."""
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    data = buffer.getvalue()
+    ref = hashlib.sha256(data).hexdigest()
+
+    # Identical images are stored once
+    path = asset_path(ref)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Writing to a temporary file first so readers never see a partial image
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_file.name, path)
+    return ref
+
+def save_images(images):
+    """Store extracted document images, returning a mapping of image name to reference."""
+    return {name: save_image(image) for name, image in images.items()}
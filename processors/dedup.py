@@ -0,0 +1,253 @@
+import os
+import re
+import json
+import time
+import uuid
+import zlib
+import socket
+import hashlib
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from utils.sqlite import connect
+
+# MinHash signature length, split into LSH bands of BAND_ROWS values each
+NUM_PERM = 128
+BAND_ROWS = 8
+NUM_BANDS = NUM_PERM // BAND_ROWS
+# Words per shingle
+SHINGLE_WORDS = 3
+# Numbers, amounts and dates, which must match exactly for chunks to collapse
+FACT_PATTERN = re.compile(r"\d+(?:[.,:/-]\d+)*")
+MERSENNE_PRIME = (1 << 61) - 1
+# Seconds after which a chunk reserved but never marked stored is reclaimed, even if its writer still runs
+RESERVATION_TIMEOUT = float(os.environ.get("DEDUP_RESERVATION_TIMEOUT", "3600"))
+
+# Fixed permutations, so signatures stored by one process match those of another
+_rng = np.random.default_rng(1)
+_perm_a = _rng.integers(1, 1 << 31, NUM_PERM, dtype=np.uint64)
+_perm_b = _rng.integers(0, 1 << 31, NUM_PERM, dtype=np.uint64)
+
+def shingles(text: str) -> np.ndarray:
+    """32-bit hashes of the overlapping word n-grams of a text"""
+    words = re.findall(r"\w+", text.lower())
+    grams = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    return np.fromiter((zlib.crc32(gram.encode()) for gram in grams), dtype=np.uint64, count=len(grams))
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature of a text's shingle set"""
+    hashes = shingles(text)
+    return ((hashes[:, None] * _perm_a + _perm_b) % MERSENNE_PRIME).min(axis=0)
+
+def band_keys(signature: np.ndarray) -> List[Tuple[int, int]]:
+    """(band, bucket) pairs under which a signature is indexed"""
+    keys = []
+    for band in range(NUM_BANDS):
+        digest = hashlib.blake2b(signature[band * BAND_ROWS:(band + 1) * BAND_ROWS].tobytes(), digest_size=8).digest()
+        keys.append((band, int.from_bytes(digest, "big", signed=True)))
+    return keys
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Jaccard similarity estimated from two signatures"""
+    return float(np.mean(first == second))
+
+def fact_fingerprint(text: str) -> str:
+    """Hash of the numbers and dates in a text, in order"""
+    return hashlib.blake2b(" ".join(FACT_PATTERN.findall(text)).encode(), digest_size=8).hexdigest()
+
+def reservation_owner() -> str:
+    """Identifies the writing process in the reservations it holds"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def owner_alive(owner: Optional[str]) -> bool:
+    """Whether the process holding a reservation may still store it"""
+    host, _, pid = (owner or "").rpartition(":")
+    if not host or not pid.isdigit():
+        return False
+    # Processes of other hosts can't be checked, so only the timeout reclaims their reservations
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def chunk_sources(metadata: dict) -> List[str]:
+    """Every source a stored chunk stands for, including collapsed near-duplicates"""
+    if metadata.get("sources"):
+        return json.loads(metadata["sources"])
+    return [metadata["source"]] if metadata.get("source") else []
+
+class NearDuplicateIndex:
+    """
+    Persistent MinHash/LSH index of the chunks stored in each shard.
+
+    Chunks whose estimated Jaccard similarity to a stored chunk (or to an
+    earlier chunk of the same batch) reaches the threshold, and whose
+    numbers and dates are exactly the same, are not embedded; their source
+    is added to the representative's source list instead. Two invoices
+    that differ only in amounts or dates are therefore both kept.
+    Signatures are split into NUM_BANDS bands, and only chunks sharing a
+    band bucket are compared.
+
+    Chunks only collapse onto chunks marked stored, so a chunk is never
+    dropped in favour of one that may never reach the vectorstore. New
+    chunks are reserved in the lookup's write transaction until their writer
+    marks them stored or releases them. Reservations left behind by a writer
+    that was killed, or that are older than RESERVATION_TIMEOUT, are
+    reclaimed by the next lookup in their shard.
+    """
+    def __init__(self, path: str, threshold: float):
+        """Open the index database, creating its tables if needed"""
+        self.path = path
+        self.threshold = threshold
+        with connect(self.path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id TEXT PRIMARY KEY,
+                    shard TEXT NOT NULL,
+                    signature BLOB NOT NULL,
+                    sources TEXT NOT NULL
+                )
+            """)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(chunks)")}
+            # Chunks indexed before facts were tracked never match, since their facts are unknown
+            if "facts" not in columns:
+                conn.execute("ALTER TABLE chunks ADD COLUMN facts TEXT")
+            if "stored" not in columns:
+                conn.execute("ALTER TABLE chunks ADD COLUMN stored INTEGER NOT NULL DEFAULT 1")
+            # Reservations made before owners were tracked are reclaimed on the next lookup
+            if "owner" not in columns:
+                conn.execute("ALTER TABLE chunks ADD COLUMN owner TEXT")
+                conn.execute("ALTER TABLE chunks ADD COLUMN reserved_at REAL")
+            conn.execute("CREATE INDEX IF NOT EXISTS chunks_pending ON chunks (shard, stored)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS bands (
+                    shard TEXT NOT NULL,
+                    band INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    chunk_id TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS bands_lookup ON bands (shard, band, bucket)")
+
+    def _reclaim(self, conn, shard: str) -> int:
+        """Drop the shard's reservations whose writer died or never finished storing them"""
+        rows = conn.execute(
+            "SELECT id, owner, reserved_at FROM chunks WHERE shard = ? AND stored = 0", (shard,)
+        ).fetchall()
+        expired = time.time() - RESERVATION_TIMEOUT
+        stale = [
+            (row["id"],) for row in rows
+            if row["reserved_at"] is None or row["reserved_at"] < expired or not owner_alive(row["owner"])
+        ]
+        conn.executemany("DELETE FROM bands WHERE chunk_id = ?", stale)
+        conn.executemany("DELETE FROM chunks WHERE id = ?", stale)
+        return len(stale)
+
+    def _find_indexed(self, conn, shard: str, keys, signature: np.ndarray, facts: str) -> Optional[str]:
+        """Id of the most similar stored chunk with the same facts above the threshold, if any"""
+        placeholders = ", ".join("(?, ?)" for _ in keys)
+        rows = conn.execute(
+            f"""SELECT id, signature FROM chunks WHERE stored = 1 AND facts = ? AND id IN (
+                    SELECT chunk_id FROM bands WHERE shard = ? AND (band, bucket) IN (VALUES {placeholders})
+                )""",
+            [facts, shard] + [value for key in keys for value in key],
+        ).fetchall()
+        best_id, best = None, self.threshold
+        for row in rows:
+            score = similarity(signature, np.frombuffer(row["signature"], dtype=np.uint64))
+            if score >= best:
+                best_id, best = row["id"], score
+        return best_id
+
+    def _add_source(self, conn, chunk_id: str, source: str) -> Optional[List[str]]:
+        """Append a source to an indexed chunk, returning its full list if it changed"""
+        sources = json.loads(conn.execute("SELECT sources FROM chunks WHERE id = ?", (chunk_id,)).fetchone()["sources"])
+        if source in sources:
+            return None
+        sources.append(source)
+        conn.execute("UPDATE chunks SET sources = ? WHERE id = ?", (json.dumps(sources), chunk_id))
+        return sources
+
+    def deduplicate(self, shard: str, chunks: List[Document]) -> Tuple[List[Document], Dict[str, List[str]]]:
+        """
+        Collapse near-duplicates of one shard's new chunks and reserve the rest.
+
+        Returns the chunks to embed, with ids assigned and a "sources" list in
+        their metadata, and the full source lists of stored chunks that
+        absorbed duplicates. Call mark_stored once the chunks are stored, or
+        release if storing them failed; reservations of a writer that dies
+        before either are reclaimed by a later call.
+        """
+        unique, signatures, facts_list, batch_buckets = [], [], [], {}
+        updated: Dict[str, List[str]] = {}
+        with connect(self.path) as conn:
+            # One write transaction, so no other writer reserves the same chunk in between
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._reclaim(conn, shard)
+                for chunk in chunks:
+                    signature = minhash(chunk.page_content)
+                    facts = fact_fingerprint(chunk.page_content)
+                    keys = band_keys(signature)
+                    source = chunk.metadata.get("source")
+
+                    # Comparing with earlier chunks of this batch first
+                    candidates = {batch_buckets[key] for key in keys if key in batch_buckets}
+                    candidates = [i for i in candidates if facts_list[i] == facts]
+                    match = max(candidates, key=lambda i: similarity(signature, signatures[i]), default=None)
+                    if match is not None and similarity(signature, signatures[match]) >= self.threshold:
+                        sources = json.loads(unique[match].metadata["sources"])
+                        if source not in sources:
+                            unique[match].metadata["sources"] = json.dumps(sources + [source])
+                        continue
+
+                    indexed = self._find_indexed(conn, shard, keys, signature, facts)
+                    if indexed is not None:
+                        sources = self._add_source(conn, indexed, source)
+                        if sources is not None:
+                            updated[indexed] = sources
+                        continue
+
+                    chunk.id = chunk.id or str(uuid.uuid4())
+                    chunk.metadata["sources"] = json.dumps([source])
+                    for key in keys:
+                        batch_buckets.setdefault(key, len(unique))
+                    unique.append(chunk)
+                    signatures.append(signature)
+                    facts_list.append(facts)
+
+                owner, now = reservation_owner(), time.time()
+                for chunk, signature, facts in zip(unique, signatures, facts_list):
+                    conn.execute(
+                        """INSERT OR REPLACE INTO chunks (id, shard, signature, sources, facts, stored, owner, reserved_at)
+                           VALUES (?, ?, ?, ?, ?, 0, ?, ?)""",
+                        (chunk.id, shard, signature.tobytes(), chunk.metadata["sources"], facts, owner, now),
+                    )
+                    conn.executemany(
+                        "INSERT INTO bands (shard, band, bucket, chunk_id) VALUES (?, ?, ?, ?)",
+                        [(shard, band, bucket, chunk.id) for band, bucket in band_keys(signature)],
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return unique, updated
+
+    def mark_stored(self, chunks: List[Document]):
+        """Mark reserved chunks as stored, so later chunks can collapse onto them"""
+        with connect(self.path) as conn:
+            conn.executemany("UPDATE chunks SET stored = 1 WHERE id = ?", [(chunk.id,) for chunk in chunks])
+
+    def release(self, chunks: List[Document]):
+        """Drop the reservations of chunks that could not be stored"""
+        ids = [(chunk.id,) for chunk in chunks]
+        with connect(self.path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("DELETE FROM bands WHERE chunk_id = ?", ids)
+            conn.executemany("DELETE FROM chunks WHERE id = ?", ids)
+            conn.execute("COMMIT")
@@ -1,25 +1,66 @@
 import os
-import tempfile
+import re
 import json
-import streamlit as st
+import hashlib
+import logging
+import threading
 from marker.converters.pdf import PdfConverter
 from marker.models import create_model_dict
 from marker.output import text_from_rendered
 from marker.config.parser import ConfigParser
-from langchain_openai import AzureChatOpenAI
+from utils.llm import create_chat_model
 import chromadb
+from chromadb.api import ServerAPI
+from chromadb.api.client import Client
+from chromadb.config import Settings, System
+from chromadb.telemetry.product import ProductTelemetryClient
 from langchain_chroma import Chroma
 from langchain_ollama import OllamaEmbeddings
+from processors.asset_store import save_images
+from processors.numpy_store import NumpyVectorStore
+from processors.sharding import ShardedVectorStore
+from processors.dedup import NearDuplicateIndex
+from processors.embedding_dispatcher import BatchingEmbeddings, EmbeddingDispatcher, QueryCache
+
+logger = logging.getLogger(__name__)
 
 PERSIST_DIRECTORY = os.path.join(os.getcwd(), "chroma_db")
+NUMPY_DIRECTORY = os.path.join(os.getcwd(), "numpy_db")
+# Shards are named <prefix>-<tenant>--<document type>
+COLLECTION_PREFIX = "doc-rag"
+# Single collection used before sharding, still searched for the default tenant
 COLLECTION_NAME = "doc-rag-chroma"
+DEFAULT_TENANT = "default"
+DOCUMENT_TYPES = ("INVOICE", "BILL", "LEGAL", "REPORT")
+OTHER_DOCUMENT_TYPE = "OTHER"
+# "chroma" (HNSW, approximate) or "numpy" (exact brute force over memory-mapped vectors)
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma").lower()
+# "none" or "int8" (numpy backend only: int8 scan with float32 rescoring of the top candidates)
+VECTOR_QUANTIZATION = os.environ.get("VECTOR_QUANTIZATION", "none").lower()
+if VECTOR_QUANTIZATION != "none" and VECTOR_BACKEND != "numpy":
+    logger.warning(f"VECTOR_QUANTIZATION={VECTOR_QUANTIZATION} only applies to the numpy backend, "
+                   f"{VECTOR_BACKEND} keeps full-precision vectors")
+# Estimated Jaccard similarity above which a chunk is collapsed onto a stored one with the same numbers and dates
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", "0.9"))
+EMBEDDING_MODEL = "llama3.2:latest"
+PARSER_DEPLOYMENT = "gpt-4-2"
+# Candidates fetched per question, narrowed down by the reranker
+RETRIEVAL_K = 20
+
+# Global converter, loaded once per process
+converter = None
+# Global embedding model, batching every embedding call of the process
+embeddings = None
 
 def initialize_models():
     """Initialize all the document parsing models at startup."""
-    st.info("Loading document processing models...")
+    global converter
+    if converter is not None:
+        return converter
+
+    logger.info("Loading document processing models...")
     # Creating models dictionary to cache models
-    if "model_dict" not in st.session_state:
-        st.session_state.model_dict = create_model_dict()
+    model_dict = create_model_dict()
     
     # Creating configuration for document processing
     config = {
@@ -30,164 +71,301 @@ def initialize_models():
     config_parser = ConfigParser(config)
     
     # Caching the converter and processor
-    if "converter" not in st.session_state:
-        st.session_state.converter = PdfConverter(
-            artifact_dict=st.session_state.model_dict,
-            config=config_parser.generate_config_dict(),
-            processor_list=config_parser.get_processors(),
-            renderer=config_parser.get_renderer(),
-        )
+    converter = PdfConverter(
+        artifact_dict=model_dict,
+        config=config_parser.generate_config_dict(),
+        processor_list=config_parser.get_processors(),
+        renderer=config_parser.get_renderer(),
+    )
     
-    st.success("Document processing models loaded successfully!")
-    return st.session_state.converter
-
-def process_document(uploaded_file):
-    """Process an uploaded document using Marker."""
-    # Ensuring models are initialized
-    converter = st.session_state.get("converter")
-    if not converter:
-        converter = initialize_models()
+    logger.info("Document processing models loaded successfully!")
+    return converter
+
+def get_embeddings():
+    """Get the embedding model shared by ingestion and retrieval, coalescing concurrent calls into batches."""
+    global embeddings
+    if embeddings is None:
+        embeddings = BatchingEmbeddings(EmbeddingDispatcher(OllamaEmbeddings(model=EMBEDDING_MODEL)), QueryCache())
+    return embeddings
+
+def convert_document(file_path):
+    """Convert a document on disk to markdown text and images using Marker."""
+    rendered = initialize_models()(file_path)
+    text, _, images = text_from_rendered(rendered)
+    return text, images
+
+def extract_structured_data(text):
+    """Parse the markdown text of a document into structured JSON with the LLM."""
+    # Parsing is background work, so it yields to chat calls on the same deployment
+    llm = create_chat_model(PARSER_DEPLOYMENT, background=True)
+    prompt = f'''
+    You are an expert at parsing Markdown documents into structured JSON.
+    Given a Markdown representation of a document (which may include text blocks, tables, bullet points, headings, etc.), extract all the meaningful information and organize it into a clean and logical JSON structure.
+    Follow these guidelines:
+    - Identify sections based on headings and their contents.
+    - For any tables (e.g., services list), parse them fully into arrays of objects with appropriate fields.
+    - If a value is missing for a field, omit it (do not guess or fill).
+    - Keep all numeric values (amounts, quantities) cleanly extracted not in strings.
+    - Preserve original wording where possible.
+    - Do not hallucinate data not present in the Markdown.
+    - One last important thing I want you to give response with data and metadata which contains following fields.
+        - issue_date
+        - due_date (optional)
+        - document_type: "INVOICE", "BILL", "LEGAL", "REPORT"
+    - dates should have specific format like DD Month YYYY for example 16 May 2025
+    - don't include new line character in response even if whole document comes in oneline
+    Output only the final JSON, nothing else.
+    Format the JSON cleanly with proper nesting.
+        $$$
+        {text}
+        $$$
+    '''
     
-    # Saving the uploaded file to a temporary location
-    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-        tmp_file.write(uploaded_file.getvalue())
-        tmp_file_path = tmp_file.name
+    structured_data = llm.invoke(prompt)
+    json_string = structured_data.content
+    clean_json_string = json_string.replace("\n", "")
+    return json.loads(clean_json_string)
+
+def process_file(file_path, filename):
+    """Process a document on disk into text, structured data and image references."""
+    text, images = convert_document(file_path)
+    structured_data = extract_structured_data(text)
     
-    # Converting document
-    try:
-        rendered = converter(tmp_file_path)
-        text, _, images = text_from_rendered(rendered)
-        
-        # Parsing document with LLM
-        llm = AzureChatOpenAI(deployment_name="gpt-4-2")
-        prompt = f'''
-        You are an expert at parsing Markdown documents into structured JSON.
-        Given a Markdown representation of a document (which may include text blocks, tables, bullet points, headings, etc.), extract all the meaningful information and organize it into a clean and logical JSON structure.
-        Follow these guidelines:
-        - Identify sections based on headings and their contents.
-        - For any tables (e.g., services list), parse them fully into arrays of objects with appropriate fields.
-        - If a value is missing for a field, omit it (do not guess or fill).
-        - Keep all numeric values (amounts, quantities) cleanly extracted not in strings.
-        - Preserve original wording where possible.
-        - Do not hallucinate data not present in the Markdown.
-        - One last important thing I want you to give response with data and metadata which contains following fields.
-            - issue_date
-            - due_date (optional)
-            - document_type: "INVOICE", "BILL", "LEGAL", "REPORT"
-        - dates should have specific format like DD Month YYYY for example 16 May 2025
-        - don't include new line character in response even if whole document comes in oneline
-        Output only the final JSON, nothing else.
-        Format the JSON cleanly with proper nesting.
-            $$$
-            {text}
-            $$$
-        '''
-        
-        structured_data = llm.invoke(prompt)
-        json_string = structured_data.content
-        clean_json_string = json_string.replace("\n", "")
-        
-        # Cleaning up temporary file
-        os.unlink(tmp_file_path)
-        
-        return {
-            "text": text,
-            "structured_data": json.loads(clean_json_string),
-            "images": images,
-            "filename": uploaded_file.name
-        }
-    except Exception as e:
-        # Cleaning up temporary file
-        os.unlink(tmp_file_path)
-        st.error(f"Error processing document: {e}")
+    # Keeping only references to the images, the pixels live in the asset store
+    return {
+        "text": text,
+        "structured_data": structured_data,
+        "images": save_images(images),
+        "filename": filename
+    }
+
+def normalize_document_type(document_type):
+    """Map an extracted document type onto one of the known shard types."""
+    document_type = (document_type or "").strip().upper()
+    return document_type if document_type in DOCUMENT_TYPES else OTHER_DOCUMENT_TYPE
+
+def tenant_slug(tenant):
+    """Collection-safe form of a tenant name, unique per tenant."""
+    tenant = tenant or DEFAULT_TENANT
+    if tenant == DEFAULT_TENANT:
+        return DEFAULT_TENANT
+    # The readable part is lossy ("acme.inc" and "acme inc"), so a hash of the exact name keeps tenants apart
+    readable = re.sub(r"[^a-z0-9]+", "-", tenant.lower()).strip("-")[:31] or "tenant"
+    return f"{readable}-{hashlib.sha1(tenant.encode()).hexdigest()[:8]}"
+
+def shard_name(tenant, document_type):
+    """Name of the collection holding one tenant's documents of one type."""
+    return f"{COLLECTION_PREFIX}-{tenant_slug(tenant)}--{normalize_document_type(document_type).lower()}"
+
+def parse_shard_name(name):
+    """Split a collection name into (tenant, document type), or None if it is not a shard."""
+    if name == COLLECTION_NAME:
+        return DEFAULT_TENANT, None
+    if not name.startswith(f"{COLLECTION_PREFIX}-") or "--" not in name:
         return None
+    tenant, document_type = name[len(COLLECTION_PREFIX) + 1:].rsplit("--", 1)
+    return tenant, document_type.upper()
+
+def list_collections():
+    """Names of all collections in the active backend."""
+    if VECTOR_BACKEND == "numpy":
+        if not os.path.exists(NUMPY_DIRECTORY):
+            return []
+        return [name for name in os.listdir(NUMPY_DIRECTORY) if NumpyVectorStore.exists(name, NUMPY_DIRECTORY)]
 
-def check_vectorstore_exists():
-    """Check if vectorstore exists and return documents if it does."""
     if not os.path.exists(PERSIST_DIRECTORY):
-        return False
-    
-    try:
-        # Checking if the collection exists
-        client = chromadb.PersistentClient(path=PERSIST_DIRECTORY)
-        collections = client.list_collections()
-        
-        return COLLECTION_NAME in collections
-    except Exception as e:
-        st.error(f"Error checking vectorstore: {e}")
-        return False
+        return []
+    client = chromadb.PersistentClient(path=PERSIST_DIRECTORY)
+    return list(client.list_collections())
 
-def get_document_count():
-    """Get the count of documents in the vectorstore."""
-    if not check_vectorstore_exists():
-        return 0
-    
+def list_shards(tenant=None):
+    """Map shard collection names to (tenant, document type), optionally for one tenant only."""
     try:
-        client = chromadb.PersistentClient(path=PERSIST_DIRECTORY)
-        collection = client.get_collection(COLLECTION_NAME)
-        return collection.count()
+        names = list_collections()
     except Exception as e:
-        st.error(f"Error getting document count: {e}")
-        return 0
+        logger.error(f"Error listing collections: {e}")
+        return {}
+
+    shards = {}
+    for name in names:
+        parsed = parse_shard_name(name)
+        if parsed is None or (tenant and parsed[0] != tenant_slug(tenant)):
+            continue
+        shards[name] = parsed
+    return shards
+
+def check_vectorstore_exists(tenant=None):
+    """Check if any shard exists, for one tenant or overall."""
+    return bool(list_shards(tenant))
+
+# Chroma systems opened by refresh_vectorstore, one per tenant
+chroma_systems = {}
+chroma_systems_lock = threading.Lock()
+
+def open_fresh_chroma_client(tenant=DEFAULT_TENANT):
+    """
+    Open a Chroma client on a newly started system for one tenant.
 
-def load_vectorstore():
-    """Load existing vectorstore."""
-    if not check_vectorstore_exists():
+    Chroma shares one system per path across the process and only replays the
+    write log of other processes when a system starts. The tenant's previous
+    system is stopped once the new one is up, so refreshes don't pile up
+    systems; the newest system also becomes the one shared by the process.
+    """
+    os.makedirs(PERSIST_DIRECTORY, exist_ok=True)
+    system = System(Settings(is_persistent=True, persist_directory=PERSIST_DIRECTORY))
+    system.instance(ProductTelemetryClient)
+    system.instance(ServerAPI)
+    system.start()
+    with chroma_systems_lock:
+        client = Client.from_system(system)
+        previous = chroma_systems.get(tenant_slug(tenant))
+        chroma_systems[tenant_slug(tenant)] = system
+    if previous is not None:
+        previous.stop()
+    return client
+
+def open_collection(name, client=None):
+    """Open a collection of the active backend, creating it if it does not exist yet."""
+    if VECTOR_BACKEND == "numpy":
+        return NumpyVectorStore(name, get_embeddings(), NUMPY_DIRECTORY, VECTOR_QUANTIZATION)
+
+    # Creating a persistent directory for the database
+    if not os.path.exists(PERSIST_DIRECTORY):
+        os.makedirs(PERSIST_DIRECTORY)
+
+    client = client or chromadb.PersistentClient(path=PERSIST_DIRECTORY)
+    return Chroma(
+        client=client,
+        collection_name=name,
+        embedding_function=get_embeddings(),
+        persist_directory=PERSIST_DIRECTORY
+    )
+
+def count_collection(name):
+    """Count the chunks stored in one collection."""
+    if VECTOR_BACKEND == "numpy":
+        return open_collection(name).count()
+    client = chromadb.PersistentClient(path=PERSIST_DIRECTORY)
+    return client.get_collection(name).count()
+
+def get_shard_stats(tenant=None):
+    """Per-shard chunk counts, for one tenant or overall."""
+    stats = []
+    for name, (shard_tenant, document_type) in sorted(list_shards(tenant).items()):
+        try:
+            chunks = count_collection(name)
+        except Exception as e:
+            logger.error(f"Error counting shard {name}: {e}")
+            chunks = 0
+        stats.append({
+            "tenant": shard_tenant,
+            "document_type": document_type or "UNSHARDED",
+            "collection": name,
+            "chunks": chunks,
+        })
+    return stats
+
+def create_retriever(vectorstore):
+    """Create a retriever that over-fetches candidates for reranking."""
+    return vectorstore.as_retriever(search_kwargs={"k": RETRIEVAL_K})
+
+def load_vectorstore(tenant=DEFAULT_TENANT, client=None):
+    """Load a tenant's shards as one routed vectorstore, optionally through a given Chroma client."""
+    shards = list_shards(tenant)
+    if not shards:
         return None
     
     try:
-        # Initializing embeddings
-        embd = OllamaEmbeddings(model="llama3.2:latest")
-        
-        # Loading existing vectorstore
-        client = chromadb.PersistentClient(path=PERSIST_DIRECTORY)
-        vectorstore = Chroma(
-            client=client,
-            collection_name=COLLECTION_NAME,
-            embedding_function=embd,
-            persist_directory=PERSIST_DIRECTORY
+        return ShardedVectorStore(
+            tenant,
+            {name: open_collection(name, client) for name in shards},
+            {name: document_type for name, (_, document_type) in shards.items()},
+            get_embeddings(),
         )
-        
-        return vectorstore
     except Exception as e:
-        st.error(f"Error loading vectorstore: {e}")
+        logger.error(f"Error loading vectorstore: {e}")
         return None
 
-def create_vectorstore(documents):
-    """Create a vectorstore from the processed documents."""
+def refresh_vectorstore(tenant=DEFAULT_TENANT):
+    """Reload the vectorstore so chunks and shards written by other processes become visible."""
+    # Chroma only replays other processes' writes when a system starts, so the
+    # tenant's shards are reopened on a system of their own; the numpy store
+    # remaps appended rows on every search by itself
+    if VECTOR_BACKEND == "chroma":
+        if not list_shards(tenant):
+            return None
+        return load_vectorstore(tenant, open_fresh_chroma_client(tenant))
+    return load_vectorstore(tenant)
+
+def split_documents(documents, tenant=DEFAULT_TENANT):
+    """Split processed documents into chunks tagged with their source, tenant and type."""
     from langchain.text_splitter import RecursiveCharacterTextSplitter
     
-    # Creating a persistent directory for the database
-    if not os.path.exists(PERSIST_DIRECTORY):
-        os.makedirs(PERSIST_DIRECTORY)
-    
-    # Extracting text content from the processed documents
-    texts = [doc["text"] for doc in documents]
-    
     # Splitting into chunks
     text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
         chunk_size=500, chunk_overlap=0
     )
     
     doc_splits = []
-    for i, text in enumerate(texts):
-        chunks = text_splitter.create_documents([text], metadatas=[{"source": documents[i]["filename"]}])
+    for doc in documents:
+        document_type = (doc["structured_data"].get("metadata") or {}).get("document_type")
+        metadata = {
+            "source": doc["filename"],
+            "tenant": tenant,
+            "document_type": normalize_document_type(document_type),
+        }
+        chunks = text_splitter.create_documents([doc["text"]], metadatas=[metadata])
         doc_splits.extend(chunks)
-    
-    try:
-        embd = OllamaEmbeddings(model="llama3.2:latest")
+    return doc_splits
 
-        client = chromadb.PersistentClient(path=PERSIST_DIRECTORY)
+def get_dedup_index():
+    """Open the near-duplicate index kept alongside the active backend's collections."""
+    directory = NUMPY_DIRECTORY if VECTOR_BACKEND == "numpy" else PERSIST_DIRECTORY
+    os.makedirs(directory, exist_ok=True)
+    return NearDuplicateIndex(os.path.join(directory, "dedup.db"), DEDUP_THRESHOLD)
 
-        vectorstore = Chroma.from_documents(
-            documents=doc_splits,
-            collection_name=COLLECTION_NAME,
-            embedding=embd,
-            client=client,
-            persist_directory=PERSIST_DIRECTORY,
-        )
-        
-        return vectorstore
-    except Exception as e:
-        st.error(f"Error creating vectorstore: {e}")
-        return None 
\ No newline at end of file
+def update_chunk_sources(vectorstore, sources_by_id):
+    """Record the full source list on stored chunks that absorbed near-duplicates."""
+    if not sources_by_id:
+        return
+    current = vectorstore.get(ids=list(sources_by_id), include=["metadatas"])
+    ids = current["ids"]
+    metadatas = [
+        {**metadata, "sources": json.dumps(sources_by_id[id_])}
+        for id_, metadata in zip(ids, current["metadatas"])
+    ]
+    # Metadata-only updates, so the chunks are not embedded again
+    if isinstance(vectorstore, NumpyVectorStore):
+        vectorstore.update_metadatas(ids, metadatas)
+    else:
+        vectorstore._collection.update(ids=ids, metadatas=metadatas)
+
+def add_chunks_to_vectorstore(doc_splits):
+    """Embed and store document chunks in their tenant and type shard, collapsing near-duplicates.
+
+    Returns the number of chunks given and the number actually embedded and stored.
+    """
+    by_shard = {}
+    for chunk in doc_splits:
+        name = shard_name(chunk.metadata.get("tenant", DEFAULT_TENANT), chunk.metadata.get("document_type"))
+        by_shard.setdefault(name, []).append(chunk)
+    
+    index = get_dedup_index()
+    stored = 0
+    for name, chunks in by_shard.items():
+        unique, absorbed = index.deduplicate(name, chunks)
+        vectorstore = open_collection(name)
+        if unique:
+            try:
+                vectorstore.add_documents(unique, ids=[chunk.id for chunk in unique])
+            except BaseException:
+                index.release(unique)
+                raise
+            index.mark_stored(unique)
+        update_chunk_sources(vectorstore, absorbed)
+        stored += len(unique)
+    
+    if doc_splits:
+        logger.info(f"Stored {stored} of {len(doc_splits)} chunks, "
+                    f"{1 - stored / len(doc_splits):.0%} collapsed as near-duplicates")
+    return {"chunks": len(doc_splits), "stored": stored}
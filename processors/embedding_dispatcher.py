@@ -0,0 +1,248 @@
+import os
+import time
+import logging
+import heapq
+import asyncio
+import threading
+import itertools
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# Lanes; lower is dispatched first
+QUERY = 0
+INGEST = 1
+LANE_NAMES = {QUERY: "query", INGEST: "ingest"}
+
+# How long the first waiting text is held for others to join its batch
+BATCH_WINDOW = float(os.environ.get("EMBED_BATCH_WINDOW_MS", "5")) / 1000
+# Texts per embedding request
+MAX_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "64"))
+# Query strings whose vectors are kept; 0 disables the cache
+QUERY_CACHE_SIZE = int(os.environ.get("EMBED_QUERY_CACHE_SIZE", "1024"))
+
+class EmbeddingDispatcher:
+    """
+    Coalesces concurrent embedding requests into micro-batches.
+
+    Callers queue texts and get futures back. A single dispatcher thread
+    waits up to BATCH_WINDOW after the oldest queued text (or until a batch
+    is full), then embeds up to MAX_BATCH_SIZE texts in one request, query
+    texts before ingest texts, so a question never waits behind more than
+    the ingest batch already running. Identical texts in a batch are only
+    embedded once, and texts whose caller was cancelled are skipped. If a
+    batch fails, its texts are retried one by one so a bad text only fails
+    its own caller.
+    """
+    def __init__(self, embeddings: Embeddings, window: float = BATCH_WINDOW, max_batch_size: int = MAX_BATCH_SIZE):
+        """Wrap an embedding model; the dispatcher thread starts on the first request"""
+        self.embeddings = embeddings
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.lanes = {
+            lane: {"texts": 0, "queue_wait": 0.0, "max_queue_wait": 0.0}
+            for lane in LANE_NAMES
+        }
+        self.counters = {"batches": 0, "batched_texts": 0, "embedded_texts": 0, "embed_seconds": 0.0, "errors": 0}
+        self.started = time.monotonic()
+        self._pending = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def submit(self, texts: List[str], lane: int = INGEST) -> List[Future]:
+        """Queue texts for embedding, returning one future per text"""
+        futures = [Future() for _ in texts]
+        now = time.monotonic()
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embedding-dispatcher", daemon=True)
+                self._thread.start()
+            for text, future in zip(texts, futures):
+                heapq.heappush(self._pending, (lane, next(self._sequence), now, text, future))
+            self._condition.notify()
+        return futures
+
+    def _next_batch(self):
+        """Wait for a full batch or the end of the window, then take the most urgent texts"""
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            while len(self._pending) < self.max_batch_size:
+                oldest = min(item[2] for item in self._pending)
+                remaining = oldest + self.window - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = [heapq.heappop(self._pending) for _ in range(min(self.max_batch_size, len(self._pending)))]
+        # Futures cancelled while queued (e.g. a disconnected client) are dropped
+        return [item for item in batch if item[4].set_running_or_notify_cancel()]
+
+    def _embed(self, texts: List[str]) -> Dict[str, Any]:
+        """Vectors per text, or the exception of each text that failed on its own"""
+        try:
+            return dict(zip(texts, self.embeddings.embed_documents(texts)))
+        except Exception as e:
+            if len(texts) == 1:
+                return {texts[0]: e}
+            logger.warning(f"Embedding batch of {len(texts)} texts failed ({e}), retrying them one by one")
+        results = {}
+        for text in texts:
+            try:
+                results[text] = self.embeddings.embed_documents([text])[0]
+            except Exception as e:
+                results[text] = e
+        return results
+
+    def _run(self):
+        """Dispatch batches for the life of the process"""
+        while True:
+            try:
+                self._dispatch(self._next_batch())
+            except Exception:
+                # Never letting one batch stop the thread every caller waits on
+                logger.exception("Embedding dispatcher failed on a batch")
+
+    def _dispatch(self, batch):
+        """Embed one batch and resolve its futures"""
+        if not batch:
+            return
+        started = time.monotonic()
+        texts = list(dict.fromkeys(item[3] for item in batch))
+        vectors = self._embed(texts)
+        elapsed = time.monotonic() - started
+        failed = sum(isinstance(vector, Exception) for vector in vectors.values())
+
+        with self._condition:
+            self.counters["batches"] += 1
+            self.counters["batched_texts"] += len(batch)
+            self.counters["embedded_texts"] += len(texts)
+            self.counters["embed_seconds"] += elapsed
+            self.counters["errors"] += failed
+            for lane, _, queued, _, _ in batch:
+                wait = started - queued
+                stats = self.lanes[lane]
+                stats["texts"] += 1
+                stats["queue_wait"] += wait
+                stats["max_queue_wait"] = max(stats["max_queue_wait"], wait)
+        for _, _, _, text, future in batch:
+            vector = vectors[text]
+            try:
+                if isinstance(vector, Exception):
+                    future.set_exception(vector)
+                else:
+                    future.set_result(list(vector))
+            except Exception:
+                logger.exception("Could not resolve an embedding request")
+
+    def metrics(self) -> Dict[str, Any]:
+        """Batch sizes, throughput and queue wait per lane"""
+        with self._condition:
+            queued = {name: 0 for name in LANE_NAMES.values()}
+            for lane, *_ in self._pending:
+                queued[LANE_NAMES[lane]] += 1
+            batches = max(1, self.counters["batches"])
+            return {
+                **self.counters,
+                "average_batch_size": self.counters["batched_texts"] / batches,
+                "texts_per_second": self.counters["batched_texts"] / max(1e-9, self.counters["embed_seconds"]),
+                "busy": self.counters["embed_seconds"] / max(1e-9, time.monotonic() - self.started),
+                "queued": queued,
+                "lanes": {
+                    LANE_NAMES[lane]: {
+                        "texts": stats["texts"],
+                        "average_queue_wait": stats["queue_wait"] / max(1, stats["texts"]),
+                        "max_queue_wait": stats["max_queue_wait"],
+                    }
+                    for lane, stats in self.lanes.items()
+                },
+            }
+
+class QueryCache:
+    """Thread-safe LRU of query strings and their vectors"""
+    def __init__(self, max_entries: int = QUERY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str):
+        """Cached vector of a query, or None on a miss"""
+        with self._lock:
+            vector = self._entries.get(text)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(text)
+            self.hits += 1
+            return list(vector)
+
+    def put(self, text: str, vector: List[float]):
+        """Store a query vector, evicting the least recently used beyond the bound"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[text] = list(vector)
+            self._entries.move_to_end(text)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and hit rate of the cache"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / max(1, self.hits + self.misses),
+            }
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Embedding model whose calls are coalesced by a shared dispatcher.
+
+    Queries go through the query lane and an LRU cache of query strings.
+    Documents go through `documents_lane`: ingest for stores, query for the
+    view returned by `for_queries`, used for query-time document embedding
+    such as compression.
+    """
+    def __init__(self, dispatcher: EmbeddingDispatcher, cache: QueryCache, documents_lane: int = INGEST):
+        """Share a dispatcher and query cache"""
+        self.dispatcher = dispatcher
+        self.cache = cache
+        self.documents_lane = documents_lane
+
+    def for_queries(self) -> "BatchingEmbeddings":
+        """The same model with documents embedded in the query lane"""
+        return BatchingEmbeddings(self.dispatcher, self.cache, QUERY)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        futures = self.dispatcher.submit(texts, self.documents_lane)
+        return [future.result() for future in futures]
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.cache.get(text)
+        if vector is None:
+            vector = self.dispatcher.submit([text], QUERY)[0].result()
+            self.cache.put(text, vector)
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        futures = self.dispatcher.submit(texts, self.documents_lane)
+        return list(await asyncio.gather(*(asyncio.wrap_future(future) for future in futures)))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = self.cache.get(text)
+        if vector is None:
+            vector = await asyncio.wrap_future(self.dispatcher.submit([text], QUERY)[0])
+            self.cache.put(text, vector)
+        return vector
+
+    def metrics(self) -> Dict[str, Any]:
+        """Dispatcher and query cache metrics"""
+        return {**self.dispatcher.metrics(), "query_cache": self.cache.stats()}
@@ -0,0 +1,235 @@
+"""
+Headless bulk ingestion into the document vectorstore.
+
+Walks a directory (or reads a manifest with one path per line), converts and
+parses every document across a pool of worker processes, and writes the
+chunks into the tenant's collections the chat app reads. Progress is
+checkpointed so an interrupted run resumes where it stopped.
+
+Usage:
+    python -m processors.ingest ./archive
+    python -m processors.ingest manifest.txt --workers 8 --batch-size 32
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from processors.document_processor import initialize_models, convert_document, extract_structured_data, split_documents, add_chunks_to_vectorstore, DEFAULT_TENANT
+from processors.structured_store import StructuredDataStore
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".pdf", ".jpg", ".jpeg", ".png")
+DEFAULT_CHECKPOINT = "ingest_checkpoint.jsonl"
+
+def collect_paths(source):
+    """Collect document paths from a directory or a manifest file."""
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            for name in files:
+                if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    paths.append(os.path.join(root, name))
+        return sorted(paths)
+
+    # Manifest with one path per line, blank lines and comments skipped
+    with open(source) as manifest:
+        return [line.strip() for line in manifest if line.strip() and not line.startswith("#")]
+
+def load_checkpoint(checkpoint_path):
+    """Load the last recorded status for every path in the checkpoint."""
+    statuses = {}
+    if not os.path.exists(checkpoint_path):
+        return statuses
+
+    with open(checkpoint_path) as checkpoint:
+        for line in checkpoint:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Partially written last line after a crash
+                continue
+            statuses[entry["path"]] = entry["status"]
+    return statuses
+
+def write_checkpoint(checkpoint, entries):
+    """Append entries to the checkpoint and flush them to disk."""
+    for entry in entries:
+        checkpoint.write(json.dumps(entry) + "\n")
+    checkpoint.flush()
+    os.fsync(checkpoint.fileno())
+
+def _init_worker(torch_threads):
+    """Load the Marker models once per worker process."""
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+    initialize_models()
+
+def _process_path(path):
+    """Convert and parse one document, returning the result with stage timings."""
+    timings = {}
+    try:
+        start = time.perf_counter()
+        text, _ = convert_document(path)
+        timings["convert"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        structured_data = extract_structured_data(text)
+        timings["parse"] = time.perf_counter() - start
+
+        doc = {"text": text, "structured_data": structured_data, "filename": os.path.basename(path)}
+        return {"path": path, "doc": doc, "timings": timings, "error": None}
+    except Exception as e:
+        return {"path": path, "doc": None, "timings": timings, "error": str(e)}
+
+class IngestStats:
+    """Running throughput and per-stage timing totals for an ingestion run."""
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.chunks = 0
+        self.stored = 0
+        self.stage_totals = {}
+        self.start = time.perf_counter()
+
+    def add_timings(self, timings, count=1):
+        """Record stage timings covering `count` documents."""
+        for stage, seconds in timings.items():
+            total, docs = self.stage_totals.get(stage, (0.0, 0))
+            self.stage_totals[stage] = (total + seconds, docs + count)
+
+    def report(self):
+        """Format a one-line progress report."""
+        elapsed = time.perf_counter() - self.start
+        rate = self.done / elapsed if elapsed else 0.0
+        stages = ", ".join(
+            f"{stage} {total / docs:.2f}s/doc" for stage, (total, docs) in self.stage_totals.items() if docs
+        )
+        dedup = 1 - self.stored / self.chunks if self.chunks else 0.0
+        return (f"{self.done + self.failed}/{self.total} processed "
+                f"({self.done} ok, {self.failed} failed) | {rate:.2f} docs/sec | {stages} | "
+                f"{self.stored}/{self.chunks} chunks stored ({dedup:.0%} near-duplicates)")
+
+def store_documents(docs, stats, tenant):
+    """Chunk, embed and store processed documents and keep their structured data."""
+    start = time.perf_counter()
+    doc_splits = split_documents(docs, tenant)
+    stats.add_timings({"chunk": time.perf_counter() - start}, count=len(docs))
+
+    # Embedding and writing into the tenant's shards
+    start = time.perf_counter()
+    counts = add_chunks_to_vectorstore(doc_splits)
+    stats.chunks += counts["chunks"]
+    stats.stored += counts["stored"]
+    stats.add_timings({"embed": time.perf_counter() - start}, count=len(docs))
+
+    # Keeping the structured data for the analytics tool
+    store = StructuredDataStore()
+    for doc in docs:
+        store.add(doc["filename"], doc["structured_data"], tenant)
+
+def flush_batch(batch, checkpoint, stats, tenant):
+    """Chunk, embed and store a batch of processed documents, then checkpoint them."""
+    if not batch:
+        return
+
+    try:
+        store_documents([result["doc"] for result in batch], stats, tenant)
+        entries = [{"path": result["path"], "status": "done"} for result in batch]
+        stats.done += len(batch)
+    except Exception as e:
+        # Isolating the bad documents so they are checkpointed as failed instead of aborting every resume
+        logger.warning(f"Storing a batch of {len(batch)} documents failed ({e}), retrying them one by one")
+        entries = []
+        for result in batch:
+            try:
+                store_documents([result["doc"]], stats, tenant)
+                entries.append({"path": result["path"], "status": "done"})
+                stats.done += 1
+            except Exception as e:
+                logger.error(f"Failed to store {result['path']}: {e}")
+                entries.append({"path": result["path"], "status": "failed", "error": str(e)})
+                stats.failed += 1
+
+    write_checkpoint(checkpoint, entries)
+    logger.info(stats.report())
+
+def run_ingestion(paths, checkpoint_path=DEFAULT_CHECKPOINT, workers=None, batch_size=16, retry_failed=False,
+                  tenant=DEFAULT_TENANT):
+    """Ingest documents in parallel into a tenant's shards, resuming from the checkpoint if present."""
+    workers = workers or os.cpu_count() or 1
+    statuses = load_checkpoint(checkpoint_path)
+    skip = {"done", "failed"} if not retry_failed else {"done"}
+    pending = [path for path in paths if statuses.get(path) not in skip]
+
+    logger.info(f"{len(paths) - len(pending)} documents already ingested, {len(pending)} pending")
+    stats = IngestStats(len(pending))
+    if not pending:
+        return stats
+
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+    batch = []
+    with open(checkpoint_path, "a") as checkpoint, ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(torch_threads,)
+    ) as executor:
+        queue = iter(pending)
+        in_flight = set()
+
+        # Keeping a bounded number of documents in flight
+        def fill():
+            for path in queue:
+                in_flight.add(executor.submit(_process_path, path))
+                if len(in_flight) >= workers * 2:
+                    break
+
+        fill()
+        while in_flight:
+            completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in completed:
+                in_flight.remove(future)
+                result = future.result()
+                stats.add_timings(result["timings"])
+                if result["error"]:
+                    logger.error(f"Failed to process {result['path']}: {result['error']}")
+                    write_checkpoint(checkpoint, [{"path": result["path"], "status": "failed", "error": result["error"]}])
+                    stats.failed += 1
+                else:
+                    batch.append(result)
+
+            if len(batch) >= batch_size:
+                flush_batch(batch, checkpoint, stats, tenant)
+                batch = []
+            fill()
+
+        flush_batch(batch, checkpoint, stats, tenant)
+
+    logger.info(f"Ingestion finished: {stats.report()}")
+    return stats
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Bulk-ingest documents into the vectorstore without Streamlit.")
+    parser.add_argument("source", help="Directory to walk or manifest file with one path per line")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Checkpoint file used to resume runs")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (defaults to all cores)")
+    parser.add_argument("--batch-size", type=int, default=16, help="Documents embedded and stored per batch")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry documents that failed in earlier runs")
+    parser.add_argument("--tenant", default=DEFAULT_TENANT, help="Tenant whose collections receive the documents")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    paths = collect_paths(args.source)
+    stats = run_ingestion(paths, args.checkpoint, args.workers, args.batch_size, args.retry_failed, args.tenant)
+    return 1 if stats.failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
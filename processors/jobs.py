@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import uuid
+from processors.document_processor import DEFAULT_TENANT
+from utils.sqlite import connect
+
+JOBS_DATABASE = os.path.join(os.getcwd(), "jobs.db")
+UPLOAD_DIRECTORY = os.path.join(os.getcwd(), "uploads")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+class JobQueue:
+    """
+    Persistent ingestion job queue backed by a local SQLite database.
+
+    The Streamlit app enqueues uploaded files and polls their status, while
+    one or more worker processes claim and run the jobs.
+    """
+    def __init__(self, path: str = JOBS_DATABASE):
+        """Open the queue database, creating the jobs table if needed"""
+        self.path = path
+        with connect(self.path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    filename TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    tenant TEXT NOT NULL DEFAULT 'default',
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+            # Adding the tenant column to queues created before sharding
+            columns = [row["name"] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if "tenant" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN tenant TEXT NOT NULL DEFAULT 'default'")
+
+    def enqueue(self, filename: str, data: bytes, tenant: str = DEFAULT_TENANT) -> int:
+        """Store an uploaded file durably and queue it for ingestion into a tenant's shards"""
+        os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
+        path = os.path.join(UPLOAD_DIRECTORY, f"{uuid.uuid4().hex}_{os.path.basename(filename)}")
+        with open(path, "wb") as upload:
+            upload.write(data)
+
+        now = time.time()
+        with connect(self.path) as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (filename, path, tenant, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (filename, path, tenant, QUEUED, now, now),
+            )
+            return cursor.lastrowid
+
+    def claim(self):
+        """Atomically claim the oldest queued job, or return None if there is none"""
+        with connect(self.path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY id LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                        (RUNNING, time.time(), row["id"]),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return dict(row) if row is not None else None
+
+    def complete(self, job_id: int, result: dict):
+        """Mark a job as done and store its lightweight result record"""
+        self._finish(job_id, DONE, result=json.dumps(result))
+
+    def fail(self, job_id: int, error: str):
+        """Mark a job as failed with its error message"""
+        self._finish(job_id, FAILED, error=error)
+
+    def _finish(self, job_id: int, status: str, result: str = None, error: str = None):
+        """Record the final state of a job"""
+        with connect(self.path) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, result, error, time.time(), job_id),
+            )
+
+    def requeue_stale(self, stale_after: float) -> int:
+        """Requeue running jobs whose worker died without finishing them"""
+        with connect(self.path) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+                (QUEUED, time.time(), RUNNING, time.time() - stale_after),
+            )
+            return cursor.rowcount
+
+    def list_jobs(self, limit: int = 50, tenant: str = None):
+        """List the most recent jobs, newest first, optionally for one tenant"""
+        with connect(self.path) as conn:
+            if tenant is None:
+                rows = conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT * FROM jobs WHERE tenant = ? ORDER BY id DESC LIMIT ?", (tenant, limit)
+                ).fetchall()
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job["result"] = json.loads(job["result"]) if job["result"] else None
+            jobs.append(job)
+        return jobs
+
+    def count_done(self, tenant: str = None) -> int:
+        """Count finished jobs, optionally for one tenant, used to detect when new chunks are searchable"""
+        with connect(self.path) as conn:
+            if tenant is None:
+                return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (DONE,)).fetchone()[0]
+            return conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND tenant = ?", (DONE, tenant)
+            ).fetchone()[0]
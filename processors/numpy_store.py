@@ -0,0 +1,362 @@
+import os
+import json
+import uuid
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterable, List, Optional, Tuple
+import numpy as np
+try:
+    import fcntl
+except ImportError:  # Windows, where only one writer process is supported
+    fcntl = None
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+# Rows scored per matrix product, bounding temporary memory on large collections
+SEARCH_BLOCK_ROWS = 65536
+# "none" scans float32 rows; "int8" scans int8 codes and rescores candidates at full precision
+QUANTIZATION_MODES = ("none", "int8")
+# Candidates per requested neighbour taken from the int8 scan for rescoring
+RESCORE_FACTOR = 4
+
+def quantize_int8(vectors) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 codes and scales for float32 rows"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+class NumpyVectorStore(VectorStore):
+    """
+    Exact brute-force vector store for small collections.
+
+    Embeddings are L2-normalized and appended as float32 rows to a flat file
+    that is memory-mapped for search, so opening a collection costs almost
+    nothing and the OS page cache shares the vectors between processes.
+    Top-k is exact cosine similarity computed with one matrix product per
+    block of rows, for any number of queries at once.
+
+    With int8 quantization the scan reads one byte per dimension instead of
+    four, and only the best RESCORE_FACTOR * k candidates per query are
+    rescored against their float32 rows, which stay on disk and are paged in
+    on demand. Rows written before quantization was enabled are quantized
+    when the collection is opened.
+
+    Layout of a collection directory:
+        vectors.f32    float32 rows, one per chunk
+        vectors.i8     int8 codes per row (int8 quantization only)
+        scales.f32     float32 scale per row of codes (int8 quantization only)
+        records.jsonl  id, text and metadata per chunk, in row order, plus
+                       metadata updates that replace an earlier chunk's metadata
+        meta.json      embedding dimension
+    """
+    def __init__(self, collection_name: str, embedding_function: Embeddings, persist_directory: str,
+                 quantization: str = "none", rescore_factor: int = RESCORE_FACTOR):
+        """Open (or prepare) a collection directory"""
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization '{quantization}', expected one of {QUANTIZATION_MODES}")
+        self.collection_name = collection_name
+        self.embedding_function = embedding_function
+        self.directory = os.path.join(persist_directory, collection_name)
+        self._vectors_path = os.path.join(self.directory, "vectors.f32")
+        self._records_path = os.path.join(self.directory, "records.jsonl")
+        self._meta_path = os.path.join(self.directory, "meta.json")
+        self._codes_path = os.path.join(self.directory, "vectors.i8")
+        self._scales_path = os.path.join(self.directory, "scales.f32")
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self._lock = threading.Lock()
+        self._dim = None
+        self._matrix = None
+        self._codes = None
+        self._scales = None
+        self._records: List[dict] = []
+        self._rows_by_id = {}
+        self._records_offset = 0
+
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as meta:
+                self._dim = json.load(meta)["dim"]
+            if quantization == "int8":
+                self.quantize()
+
+    @staticmethod
+    def exists(collection_name: str, persist_directory: str) -> bool:
+        """Check whether a collection has been created"""
+        return os.path.exists(os.path.join(persist_directory, collection_name, "meta.json"))
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
+    def _refresh(self):
+        """Remap the vectors and read new records if another writer appended rows"""
+        if self._dim is None or not os.path.exists(self._vectors_path):
+            return
+
+        if not os.path.exists(self._records_path):
+            return
+
+        # Reading records appended since the last refresh
+        with open(self._records_path) as records:
+            records.seek(self._records_offset)
+            for line in iter(records.readline, ""):
+                if not line.endswith("\n"):
+                    # Writer still busy with this line
+                    break
+                record = json.loads(line)
+                if "update" in record:
+                    # Metadata updates patch their chunk's record instead of adding a row
+                    row = self._rows_by_id.get(record["id"])
+                    if row is not None:
+                        self._records[row]["metadata"] = record["update"]
+                else:
+                    self._rows_by_id[record["id"]] = len(self._records)
+                    self._records.append(record)
+                self._records_offset = records.tell()
+
+        # Vectors are written before their records, so the records bound the row count
+        rows = min(os.path.getsize(self._vectors_path) // (self._dim * 4), len(self._records))
+        if self._matrix is None or self._matrix.shape[0] != rows:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self._dim)) if rows else None
+
+        if self.quantization == "int8" and os.path.exists(self._scales_path):
+            # Codes are written before their scales, so the scales bound the quantized rows
+            quantized = min(os.path.getsize(self._scales_path) // 4, rows)
+            if self._codes is None or self._codes.shape[0] != quantized:
+                self._codes = np.memmap(self._codes_path, dtype=np.int8, mode="r", shape=(quantized, self._dim)) if quantized else None
+                self._scales = np.memmap(self._scales_path, dtype=np.float32, mode="r", shape=(quantized,)) if quantized else None
+
+    def count(self) -> int:
+        """Number of stored chunks"""
+        with self._lock:
+            self._refresh()
+            return 0 if self._matrix is None else self._matrix.shape[0]
+
+    @contextmanager
+    def _write_lock(self):
+        """Serialize appends across threads and, where supported, processes"""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, ".lock"), "w") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                yield
+
+    def _append_codes(self):
+        """Quantize float32 rows that have no codes yet; the caller holds the write lock"""
+        total = os.path.getsize(self._vectors_path) // (self._dim * 4) if os.path.exists(self._vectors_path) else 0
+        done = os.path.getsize(self._scales_path) // 4 if os.path.exists(self._scales_path) else 0
+        if done >= total:
+            return
+        if os.path.exists(self._codes_path) and os.path.getsize(self._codes_path) > done * self._dim:
+            # Dropping codes of an append interrupted before its scales were written
+            os.truncate(self._codes_path, done * self._dim)
+
+        vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(total, self._dim))
+        with open(self._codes_path, "ab") as codes_file, open(self._scales_path, "ab") as scales_file:
+            for start in range(done, total, SEARCH_BLOCK_ROWS):
+                codes, scales = quantize_int8(vectors[start:start + SEARCH_BLOCK_ROWS])
+                codes_file.write(codes.tobytes())
+                scales_file.write(scales.tobytes())
+            codes_file.flush()
+            os.fsync(codes_file.fileno())
+            scales_file.flush()
+            os.fsync(scales_file.fileno())
+
+    def _truncate_interrupted(self):
+        """
+        Drop what an append interrupted by a crash left behind; the caller holds the write lock.
+
+        Rows are written before their records, so rows (and codes) beyond the
+        last complete record, and a partial last record, belong to an append
+        that never finished and would misalign every later row.
+        """
+        self._refresh()
+        if os.path.exists(self._records_path) and os.path.getsize(self._records_path) > self._records_offset:
+            os.truncate(self._records_path, self._records_offset)
+        rows = len(self._records)
+        for path, row_bytes in ((self._vectors_path, self._dim * 4), (self._codes_path, self._dim), (self._scales_path, 4)):
+            if os.path.exists(path) and os.path.getsize(path) > rows * row_bytes:
+                os.truncate(path, rows * row_bytes)
+
+    def quantize(self):
+        """Bring the int8 codes up to date with the float32 rows"""
+        if self._dim is None:
+            return
+        with self._write_lock():
+            self._truncate_interrupted()
+            self._append_codes()
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        """L2-normalize rows so the dot product is cosine similarity"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+
+    def add_embeddings(self, texts: List[str], embeddings, metadatas: Optional[List[dict]] = None,
+                       ids: Optional[List[str]] = None) -> List[str]:
+        """Append pre-computed embeddings with their texts"""
+        vectors = self._normalize(embeddings)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+
+        with self._write_lock():
+            if self._dim is None and os.path.exists(self._meta_path):
+                # Another process created the collection since we opened it
+                with open(self._meta_path) as meta:
+                    self._dim = json.load(meta)["dim"]
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                with open(self._meta_path, "w") as meta:
+                    json.dump({"dim": self._dim}, meta)
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match collection dimension {self._dim}")
+
+            self._truncate_interrupted()
+            with open(self._vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            if self.quantization == "int8":
+                self._append_codes()
+            with open(self._records_path, "a") as f:
+                for id_, text, metadata in zip(ids, texts, metadatas):
+                    f.write(json.dumps({"id": id_, "text": text, "metadata": metadata}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        return ids
+
+    def update_metadatas(self, ids: List[str], metadatas: List[dict]):
+        """Replace the metadata of stored chunks"""
+        with self._write_lock():
+            with open(self._records_path, "a") as f:
+                for id_, metadata in zip(ids, metadatas):
+                    f.write(json.dumps({"id": id_, "update": metadata}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        """Embed and append texts"""
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.add_embeddings(texts, self.embedding_function.embed_documents(texts), metadatas, ids)
+
+    @staticmethod
+    def _scan(queries: np.ndarray, matrix, k: int, scales=None, offset: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """Unordered top-k (rows, scores) per query, scoring one block of rows per matrix product"""
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, matrix.shape[0], SEARCH_BLOCK_ROWS):
+            # One matrix product scores every query against this block
+            scores = queries @ np.asarray(matrix[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32).T
+            if scales is not None:
+                scores *= scales[start:start + SEARCH_BLOCK_ROWS]
+            rows = np.broadcast_to(np.arange(offset + start, offset + start + scores.shape[1]), scores.shape)
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, rows], axis=1)
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+                rows = np.take_along_axis(rows, top, axis=1)
+            best_scores, best_rows = scores, rows
+        return best_rows, best_scores
+
+    def _rescore(self, queries: np.ndarray, matrix, codes, scales, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k from the int8 scan's candidates, rescored against their float32 rows"""
+        candidates = max(k, k * self.rescore_factor)
+        rows, _ = self._scan(queries, codes, candidates, scales)
+        if codes.shape[0] < matrix.shape[0]:
+            # Rows appended since the codes were mapped are scanned at full precision
+            tail_rows, _ = self._scan(queries, matrix[codes.shape[0]:], candidates, offset=codes.shape[0])
+            rows = np.concatenate([rows, tail_rows], axis=1)
+
+        scores = np.einsum("qd,qcd->qc", queries, np.asarray(matrix[rows.ravel()]).reshape(*rows.shape, -1))
+        if scores.shape[1] > k:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(scores, top, axis=1)
+            rows = np.take_along_axis(rows, top, axis=1)
+        return rows, scores
+
+    def search_by_vectors(self, query_vectors, k: int = 4) -> List[List[Tuple[int, float]]]:
+        """Top-k (row, cosine similarity) for a batch of query vectors, exact unless quantized"""
+        queries = self._normalize(query_vectors)
+        with self._lock:
+            self._refresh()
+            matrix, codes, scales = self._matrix, self._codes, self._scales
+        if matrix is None:
+            return [[] for _ in range(len(queries))]
+
+        if codes is None:
+            best_rows, best_scores = self._scan(queries, matrix, k)
+        else:
+            best_rows, best_scores = self._rescore(queries, matrix, codes, scales, k)
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        return [list(zip(rows.tolist(), scores.tolist())) for rows, scores in zip(best_rows, best_scores)]
+
+    def _to_document(self, row: int) -> Document:
+        """Build the document stored at a row"""
+        record = self._records[row]
+        return Document(id=record["id"], page_content=record["text"], metadata=record["metadata"])
+
+    def similarity_search_with_score_batch(self, queries: List[str], k: int = 4) -> List[List[Tuple[Document, float]]]:
+        """Search several queries with one embedding call and one matrix product"""
+        results = self.search_by_vectors(self.embedding_function.embed_documents(queries), k)
+        return [[(self._to_document(row), score) for row, score in hits] for hits in results]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        """Search one query, returning documents with cosine similarity"""
+        hits = self.search_by_vectors(self.embedding_function.embed_query(query), k)[0]
+        return [(self._to_document(row), score) for row, score in hits]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        """Search one query"""
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        """Search by a pre-computed query vector"""
+        return [self._to_document(row) for row, _ in self.search_by_vectors(embedding, k)[0]]
+
+    def _select_relevance_score_fn(self):
+        """Map cosine similarity in [-1, 1] to a relevance score in [0, 1]"""
+        return lambda score: min(1.0, max(0.0, (score + 1) / 2))
+
+    def get(self, ids: Optional[List[str]] = None, include: Optional[List[str]] = None) -> dict:
+        """Fetch stored chunks by id, mirroring the shape of Chroma's get"""
+        include = include or ["documents", "metadatas"]
+        with self._lock:
+            self._refresh()
+            matrix = self._matrix
+        if matrix is None:
+            rows = []
+        elif ids is None:
+            rows = list(range(matrix.shape[0]))
+        else:
+            rows = [self._rows_by_id[id_] for id_ in ids if self._rows_by_id.get(id_, matrix.shape[0]) < matrix.shape[0]]
+
+        result = {"ids": [self._records[row]["id"] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [self._records[row]["text"] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self._records[row]["metadata"] for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = [np.asarray(matrix[row]) for row in rows]
+        return result
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   collection_name: str = "default", persist_directory: str = "numpy_db",
+                   quantization: str = "none", **kwargs: Any):
+        """Create a collection from texts"""
+        store = cls(collection_name, embedding, persist_directory, quantization)
+        store.add_texts(texts, metadatas, kwargs.get("ids"))
+        return store
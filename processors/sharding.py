@@ -0,0 +1,100 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from processors.numpy_store import NumpyVectorStore
+
+# Words in a question that point at one document type
+TYPE_KEYWORDS = {
+    "INVOICE": ("invoice", "invoices", "invoiced"),
+    "BILL": ("bill", "bills", "utility"),
+    "LEGAL": ("legal", "contract", "contracts", "agreement", "agreements", "clause", "clauses"),
+    "REPORT": ("report", "reports", "quarterly", "annual"),
+}
+
+# Shared pool fanning queries out to shards
+shard_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="shard-search")
+
+def route_document_types(query: str) -> List[str]:
+    """Document types a question is explicitly about, empty if it could be any."""
+    words = set(re.findall(r"[a-z]+", query.lower()))
+    return [doc_type for doc_type, keywords in TYPE_KEYWORDS.items() if words.intersection(keywords)]
+
+class ShardedVectorStore(VectorStore):
+    """
+    Read-only view over one tenant's collections, one per document type.
+
+    Each question is routed to the shards of the document types it mentions
+    (all of the tenant's shards if it mentions none), the query is embedded
+    once, and the shards are searched in parallel and merged by score.
+    Shards without a document type (the pre-sharding collection) are always
+    searched.
+    """
+    def __init__(self, tenant: str, shards: Dict[str, VectorStore], document_types: Dict[str, Optional[str]],
+                 embedding_function: Embeddings):
+        """Wrap the opened shards of a tenant"""
+        self.tenant = tenant
+        self.shards = shards
+        self.document_types = document_types
+        self.embedding_function = embedding_function
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
+    def route(self, query: str) -> List[str]:
+        """Names of the shards to search for a question"""
+        wanted = route_document_types(query)
+        routed = [
+            name for name, doc_type in self.document_types.items()
+            if not wanted or doc_type is None or doc_type in wanted
+        ]
+        # Falling back to every shard if the mentioned types have none
+        if not any(self.document_types[name] for name in routed):
+            return list(self.shards)
+        return routed
+
+    @staticmethod
+    def _search_shard(store: VectorStore, vector: List[float], k: int) -> List[Tuple[Document, float]]:
+        """Search one shard, returning (document, similarity) with higher meaning closer"""
+        if isinstance(store, NumpyVectorStore):
+            hits = store.search_by_vectors(vector, k)[0]
+            return [(store._to_document(row), score) for row, score in hits]
+        # Chroma reports distances; every shard shares the embedding model and metric
+        return [(doc, -distance) for doc, distance in store.similarity_search_by_vector_with_relevance_scores(vector, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        """Search the routed shards in parallel and merge the best k"""
+        names = self.route(query)
+        if not names:
+            return []
+        vector = self.embedding_function.embed_query(query)
+        results = shard_executor.map(lambda name: self._search_shard(self.shards[name], vector, k), names)
+        merged = [hit for hits in results for hit in hits]
+        merged.sort(key=lambda hit: -hit[1])
+        return merged[:k]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        """Search the routed shards"""
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def get(self, ids: Optional[List[str]] = None, include: Optional[List[str]] = None) -> dict:
+        """Fetch chunks by id from whichever shards hold them"""
+        include = include or ["documents", "metadatas"]
+        merged = {key: [] for key in ["ids"] + include}
+        for store in self.shards.values():
+            result = store.get(ids=ids, include=include)
+            for key in merged:
+                values = result.get(key)
+                if values is not None:
+                    merged[key].extend(list(values))
+        return merged
+
+    def add_texts(self, texts, metadatas=None, **kwargs: Any) -> List[str]:
+        raise NotImplementedError("Write through add_chunks_to_vectorstore, which routes chunks to their shard")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs: Any):
+        raise NotImplementedError("Sharded stores are opened with load_vectorstore")
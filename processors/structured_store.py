@@ -0,0 +1,54 @@
+import os
+import json
+import time
+from processors.document_processor import DEFAULT_TENANT, tenant_slug
+from utils.sqlite import connect
+
+STRUCTURED_DATABASE = os.path.join(os.getcwd(), "structured.db")
+
+class StructuredDataStore:
+    """
+    Structured data parsed from each document, kept per tenant in SQLite.
+
+    Written by the worker and the headless ingester next to the chunks, and
+    read by the analytics tool, so aggregates don't depend on which process
+    or session ingested a document.
+    """
+    def __init__(self, path: str = STRUCTURED_DATABASE):
+        """Open the database, creating the documents table if needed"""
+        self.path = path
+        with connect(self.path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    tenant TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    structured_data TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (tenant, filename)
+                )
+            """)
+
+    def add(self, filename: str, structured_data: dict, tenant: str = DEFAULT_TENANT):
+        """Store a document's structured data, replacing an earlier version of the same file"""
+        with connect(self.path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (tenant, filename, structured_data, updated_at) VALUES (?, ?, ?, ?)",
+                (tenant_slug(tenant), filename, json.dumps(structured_data), time.time()),
+            )
+
+    def list_documents(self, tenant: str = DEFAULT_TENANT):
+        """List (filename, structured data) of a tenant's documents"""
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                "SELECT filename, structured_data FROM documents WHERE tenant = ? ORDER BY filename",
+                (tenant_slug(tenant),),
+            ).fetchall()
+        return [(row["filename"], json.loads(row["structured_data"])) for row in rows]
+
+    def version(self, tenant: str = DEFAULT_TENANT):
+        """Cheap fingerprint of a tenant's documents, changing whenever one is added or replaced"""
+        with connect(self.path) as conn:
+            row = conn.execute(
+                "SELECT COUNT(*), MAX(updated_at) FROM documents WHERE tenant = ?", (tenant_slug(tenant),)
+            ).fetchone()
+        return tuple(row)
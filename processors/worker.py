@@ -0,0 +1,79 @@
+"""
+Background ingestion worker.
+
+Claims jobs enqueued by the Streamlit app and runs conversion, parsing and
+embedding outside the script run. Each document's chunks are written to the
+vectorstore as soon as that document finishes, so retrieval picks them up
+without waiting for the rest of the batch.
+
+Usage:
+    python -m processors.worker
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+
+from processors.document_processor import initialize_models, process_file, split_documents, add_chunks_to_vectorstore
+from processors.jobs import JobQueue
+from processors.structured_store import StructuredDataStore
+
+logger = logging.getLogger(__name__)
+
+def run_job(queue, job):
+    """Process one claimed job and record its outcome."""
+    logger.info(f"Processing job {job['id']}: {job['filename']} for tenant {job['tenant']}")
+    try:
+        doc = process_file(job["path"], job["filename"])
+        add_chunks_to_vectorstore(split_documents([doc], job["tenant"]))
+        StructuredDataStore().add(doc["filename"], doc["structured_data"], job["tenant"])
+    except Exception as e:
+        logger.exception(f"Job {job['id']} failed")
+        queue.fail(job["id"], str(e))
+        return
+
+    queue.complete(job["id"], {
+        "filename": doc["filename"],
+        "structured_data": doc["structured_data"],
+        "images": doc["images"],
+    })
+    os.unlink(job["path"])
+    logger.info(f"Job {job['id']} done")
+
+def run_worker(queue, poll_interval=2.0, stale_after=3600.0, once=False):
+    """Claim and run jobs until interrupted, or until the queue is empty with `once`."""
+    initialize_models()
+
+    requeued = queue.requeue_stale(stale_after)
+    if requeued:
+        logger.info(f"Requeued {requeued} stale jobs")
+
+    while True:
+        job = queue.claim()
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        run_job(queue, job)
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Run the background document ingestion worker.")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds to wait when the queue is empty")
+    parser.add_argument("--stale-after", type=float, default=3600.0,
+                        help="Requeue running jobs older than this many seconds on startup")
+    parser.add_argument("--once", action="store_true", help="Exit once the queue is drained")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    try:
+        run_worker(JobQueue(), args.poll_interval, args.stale_after, args.once)
+    except KeyboardInterrupt:
+        logger.info("Worker stopped")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
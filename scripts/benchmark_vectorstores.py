@@ -0,0 +1,133 @@
+"""
+Recall and latency benchmark: Chroma (HNSW) vs the NumPy brute-force store.
+
+Copies the vectors of an existing Chroma shard into a temporary NumPy
+store, then runs the same queries against both. Queries are stored vectors
+with a little noise added, or real questions embedded with the app's
+embedding model when --questions is given. Ground truth is exact search in
+each backend's own metric, so recall shows what HNSW approximation loses.
+
+Usage:
+    python -m scripts.benchmark_vectorstores --queries 200 --k 4
+    python -m scripts.benchmark_vectorstores --collection doc-rag-acme-293abb6b--invoice
+"""
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import chromadb
+
+from utils.silencer import silence_common_warnings
+silence_common_warnings()
+
+from processors.document_processor import PERSIST_DIRECTORY, get_embeddings, get_shard_stats
+from processors.numpy_store import NumpyVectorStore
+
+def exact_top_k(vectors, queries, k, space):
+    """Exact top-k row indices in Chroma's distance metric."""
+    if space == "l2":
+        distances = (queries ** 2).sum(1)[:, None] - 2 * queries @ vectors.T + (vectors ** 2).sum(1)[None, :]
+    elif space == "ip":
+        distances = -(queries @ vectors.T)
+    else:
+        normalized = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+        distances = -(queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ normalized.T
+    return np.argsort(distances, axis=1)[:, :k]
+
+def recall(results, truth):
+    """Mean fraction of the true top-k found."""
+    return float(np.mean([len(set(found) & set(expected)) / len(expected) for found, expected in zip(results, truth)]))
+
+def percentiles(latencies):
+    """Format latency percentiles in milliseconds."""
+    values = np.asarray(latencies) * 1000
+    return f"p50={np.percentile(values, 50):.2f}ms p95={np.percentile(values, 95):.2f}ms p99={np.percentile(values, 99):.2f}ms"
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark Chroma against the NumPy vector store.")
+    parser.add_argument("--queries", type=int, default=200, help="Synthetic queries sampled from stored vectors")
+    parser.add_argument("--questions", help="File with one real question per line, embedded with the app's model")
+    parser.add_argument("--k", type=int, default=4, help="Neighbours per query")
+    parser.add_argument("--noise", type=float, default=0.05, help="Relative noise added to sampled query vectors")
+    parser.add_argument("--collection", help="Shard to benchmark (defaults to the largest)")
+    args = parser.parse_args(argv)
+
+    collection_name = args.collection
+    if collection_name is None:
+        shards = get_shard_stats()
+        if not shards:
+            print("No shards found, ingest documents first")
+            return 1
+        collection_name = max(shards, key=lambda stat: stat["chunks"])["collection"]
+
+    # Loading the collection's raw vectors from Chroma
+    start = time.perf_counter()
+    client = chromadb.PersistentClient(path=PERSIST_DIRECTORY)
+    collection = client.get_collection(collection_name)
+    chroma_open = time.perf_counter() - start
+    data = collection.get(include=["embeddings", "documents", "metadatas"])
+    vectors = np.asarray(data["embeddings"], dtype=np.float32)
+    ids = data["ids"]
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    print(f"{collection_name}: {len(ids)} vectors of dimension {vectors.shape[1]}, Chroma space '{space}'")
+
+    # Building the queries
+    rng = np.random.default_rng(0)
+    if args.questions:
+        with open(args.questions) as f:
+            questions = [line.strip() for line in f if line.strip()]
+        queries = np.asarray(get_embeddings().embed_documents(questions), dtype=np.float32)
+    else:
+        sample = vectors[rng.integers(0, len(vectors), args.queries)]
+        scale = args.noise * np.linalg.norm(sample, axis=1, keepdims=True) / np.sqrt(vectors.shape[1])
+        queries = sample + rng.normal(size=sample.shape).astype(np.float32) * scale
+
+    directory = tempfile.mkdtemp()
+    try:
+        # Copying the vectors into a NumPy store
+        store = NumpyVectorStore(collection_name, None, directory)
+        store.add_embeddings(data["documents"], vectors, data["metadatas"], ids)
+        start = time.perf_counter()
+        store = NumpyVectorStore(collection_name, None, directory)
+        store.count()
+        numpy_open = time.perf_counter() - start
+
+        row_of = {id_: row for row, id_ in enumerate(ids)}
+
+        # Chroma, one query at a time
+        chroma_results, chroma_latencies = [], []
+        for query in queries:
+            start = time.perf_counter()
+            result = collection.query(query_embeddings=[query.tolist()], n_results=args.k, include=[])
+            chroma_latencies.append(time.perf_counter() - start)
+            chroma_results.append([row_of[id_] for id_ in result["ids"][0]])
+
+        # NumPy, one query at a time and all queries in one batch
+        numpy_results, numpy_latencies = [], []
+        for query in queries:
+            start = time.perf_counter()
+            hits = store.search_by_vectors(query, args.k)[0]
+            numpy_latencies.append(time.perf_counter() - start)
+            numpy_results.append([row for row, _ in hits])
+        start = time.perf_counter()
+        store.search_by_vectors(queries, args.k)
+        batch_time = time.perf_counter() - start
+    finally:
+        shutil.rmtree(directory)
+
+    chroma_truth = exact_top_k(vectors, queries, args.k, space)
+    cosine_truth = exact_top_k(vectors, queries, args.k, "cosine")
+
+    print(f"open:   chroma {chroma_open * 1000:.1f}ms  numpy {numpy_open * 1000:.1f}ms")
+    print(f"chroma: recall@{args.k} {recall(chroma_results, chroma_truth):.3f} (vs exact {space})  {percentiles(chroma_latencies)}")
+    print(f"numpy:  recall@{args.k} {recall(numpy_results, cosine_truth):.3f} (vs exact cosine)  {percentiles(numpy_latencies)}")
+    print(f"numpy batch: {len(queries)} queries in {batch_time * 1000:.1f}ms "
+          f"({batch_time / len(queries) * 1000:.3f}ms/query)")
+    print(f"overlap between backends: {recall(numpy_results, chroma_results):.3f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Measure the effect of extractive context compression.
+
+For each question, retrieves chunks from the existing vectorstore and answers
+twice: once with the raw document dump the RAG prompt used to receive and
+once with the compressed context. Reports prompt tokens for generation and
+hallucination grading, latency, and how often each answer is judged grounded
+and useful by the graph's own graders.
+
+Usage:
+    python -m scripts.eval_compression questions.txt
+"""
+import sys
+import time
+import argparse
+from langchain_core.messages import HumanMessage
+
+from utils.silencer import silence_common_warnings
+silence_common_warnings()
+
+from processors.document_processor import load_vectorstore, DEFAULT_TENANT
+from nodes.compressor import compress_documents, count_tokens
+from nodes.config import get_llm
+from nodes.grader import get_graders
+from nodes.processor import get_rag_prompt
+
+def evaluate(question, context, llm, graders):
+    """Generate an answer from a context and grade it."""
+    prompt = get_rag_prompt().format(context=context, question=question)
+
+    start = time.perf_counter()
+    generation = llm.invoke([HumanMessage(prompt)]).content
+    latency = time.perf_counter() - start
+
+    grounded = graders["hallucination_grader"].invoke({"documents": context, "generation": generation}).content
+    useful = graders["answer_grader"].invoke({"question": question, "generation": generation}).content
+    return {
+        "generation_tokens": count_tokens(prompt),
+        "grading_tokens": count_tokens(str(context)) + count_tokens(generation),
+        "latency": latency,
+        "grounded": grounded.strip().lower() == "yes",
+        "useful": useful.strip().lower() == "yes",
+    }
+
+def summarize(name, results):
+    """Print averages for one variant."""
+    count = len(results)
+    print(f"{name:<12}"
+          f"gen prompt {sum(r['generation_tokens'] for r in results) / count:8.0f} tok  "
+          f"grading {sum(r['grading_tokens'] for r in results) / count:8.0f} tok  "
+          f"latency {sum(r['latency'] for r in results) / count:6.2f}s  "
+          f"grounded {sum(r['grounded'] for r in results) / count:5.0%}  "
+          f"useful {sum(r['useful'] for r in results) / count:5.0%}")
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Compare raw and compressed RAG context.")
+    parser.add_argument("questions", help="File with one question per line")
+    parser.add_argument("--k", type=int, default=4, help="Chunks retrieved per question")
+    parser.add_argument("--tenant", default=DEFAULT_TENANT, help="Tenant whose shards are searched")
+    args = parser.parse_args(argv)
+
+    vectorstore = load_vectorstore(args.tenant)
+    if vectorstore is None:
+        print("No vectorstore found, ingest documents first")
+        return 1
+
+    with open(args.questions) as f:
+        questions = [line.strip() for line in f if line.strip()]
+
+    retriever = vectorstore.as_retriever(search_kwargs={"k": args.k})
+    llm = get_llm(None)
+    graders = get_graders()
+
+    raw_results, compressed_results = [], []
+    for question in questions:
+        documents = retriever.invoke(question)
+        if not documents:
+            continue
+        raw_results.append(evaluate(question, documents, llm, graders))
+        context = compress_documents(question, documents, vectorstore.embeddings)
+        compressed_results.append(evaluate(question, context, llm, graders))
+
+    if not raw_results:
+        print("No question retrieved any documents")
+        return 1
+
+    print(f"{len(raw_results)} questions")
+    summarize("raw", raw_results)
+    summarize("compressed", compressed_results)
+    saved = 1 - sum(r["generation_tokens"] for r in compressed_results) / sum(r["generation_tokens"] for r in raw_results)
+    print(f"generation prompt tokens saved: {saved:.0%}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Memory and recall report for int8 quantized vector storage.
+
+Copies the vectors of an existing shard (from either backend) into
+temporary NumPy stores, one at full precision and one int8 quantized, and
+runs the same queries against both. Queries are stored vectors with a
+little noise added, or real questions embedded with the app's embedding
+model when --questions is given. Recall is measured against the exact
+float32 results, with and without rescoring more candidates at full
+precision.
+
+Usage:
+    python -m scripts.eval_quantization --queries 200 --k 4
+    python -m scripts.eval_quantization --collection doc-rag-acme-293abb6b--invoice --questions questions.txt
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+from utils.silencer import silence_common_warnings
+silence_common_warnings()
+
+from processors.document_processor import get_embeddings, get_shard_stats, open_collection
+from processors.numpy_store import NumpyVectorStore
+from scripts.benchmark_vectorstores import recall, percentiles
+
+def search_all(store, queries, k):
+    """Row ids of the top-k per query, with per-query latencies."""
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits = store.search_by_vectors(query, k)[0]
+        latencies.append(time.perf_counter() - start)
+        results.append([row for row, _ in hits])
+    return results, latencies
+
+def megabytes(size):
+    """Format a byte count."""
+    return f"{size / 2 ** 20:.1f}MB"
+
+def collection_files(directory, collection_name):
+    """Size on disk of each file of a NumPy collection."""
+    path = os.path.join(directory, collection_name)
+    return {name: os.path.getsize(os.path.join(path, name)) for name in os.listdir(path) if not name.startswith(".")}
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Report memory saved and recall lost by int8 quantization.")
+    parser.add_argument("--queries", type=int, default=200, help="Synthetic queries sampled from stored vectors")
+    parser.add_argument("--questions", help="File with one real question per line, embedded with the app's model")
+    parser.add_argument("--k", type=int, default=4, help="Neighbours per query")
+    parser.add_argument("--noise", type=float, default=0.05, help="Relative noise added to sampled query vectors")
+    parser.add_argument("--collection", help="Shard to evaluate (defaults to the largest)")
+    parser.add_argument("--rescore-factors", default="1,2,4,8",
+                        help="Comma-separated candidates per neighbour rescored at full precision")
+    args = parser.parse_args(argv)
+
+    collection_name = args.collection
+    if collection_name is None:
+        shards = get_shard_stats()
+        if not shards:
+            print("No shards found, ingest documents first")
+            return 1
+        collection_name = max(shards, key=lambda stat: stat["chunks"])["collection"]
+
+    data = open_collection(collection_name).get(include=["embeddings"])
+    vectors = np.asarray(data["embeddings"], dtype=np.float32)
+    rows, dim = vectors.shape
+    print(f"{collection_name}: {rows} vectors of dimension {dim}")
+
+    # Building the queries
+    rng = np.random.default_rng(0)
+    if args.questions:
+        with open(args.questions) as f:
+            questions = [line.strip() for line in f if line.strip()]
+        queries = np.asarray(get_embeddings().embed_documents(questions), dtype=np.float32)
+    else:
+        sample = vectors[rng.integers(0, len(vectors), args.queries)]
+        scale = args.noise * np.linalg.norm(sample, axis=1, keepdims=True) / np.sqrt(dim)
+        queries = sample + rng.normal(size=sample.shape).astype(np.float32) * scale
+
+    directory = tempfile.mkdtemp()
+    try:
+        store = NumpyVectorStore(collection_name, None, directory)
+        store.add_embeddings([""] * rows, vectors, ids=data["ids"])
+        exact_results, exact_latencies = search_all(store, queries, args.k)
+        float_files = collection_files(directory, collection_name)
+
+        # Opening the same collection quantized writes its int8 codes next to the float32 rows
+        quantized = {}
+        for factor in [int(value) for value in args.rescore_factors.split(",")]:
+            quantized_store = NumpyVectorStore(collection_name, None, directory, "int8", factor)
+            quantized[factor] = search_all(quantized_store, queries, args.k)
+        int8_files = collection_files(directory, collection_name)
+    finally:
+        shutil.rmtree(directory)
+
+    # The int8 codes are added next to the float32 rows, which rescoring still needs
+    float_disk, int8_disk = sum(float_files.values()), sum(int8_files.values())
+    print(f"on disk: float32 {megabytes(float_disk)}  int8 {megabytes(int8_disk)} "
+          f"({int8_disk / float_disk:.2f}x, float32 rows are kept for rescoring)")
+
+    # Resident while searching: every scanned row, plus the float32 pages of the rescored candidates
+    row_bytes = dim * 4
+    float_resident = float_files["vectors.f32"]
+    codes_resident = int8_files["vectors.i8"] + int8_files["scales.f32"]
+    print(f"resident scan: float32 {megabytes(float_resident)}  int8 {megabytes(codes_resident)} "
+          f"({1 - codes_resident / float_resident:.0%} less)")
+    print(f"float32:          recall@{args.k} 1.000  {percentiles(exact_latencies)}")
+    for factor, (results, latencies) in quantized.items():
+        # Each rescored candidate pages in at least one 4KB page of float32 rows
+        rescored = min(rows, args.k * factor) * max(row_bytes, 4096)
+        print(f"int8 rescore x{factor}: recall@{args.k} {recall(results, exact_results):.3f}  {percentiles(latencies)}  "
+              f"+{megabytes(rescored)} float32 paged in per query")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Load test for the query API.
+
+Runs many concurrent conversations against a running API and reports
+throughput (QPS) and latency percentiles. With --stream it also reports
+time to first token.
+
+Usage:
+    python scripts/load_test.py --url http://localhost:8000 --concurrency 16 --requests 200
+"""
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_QUESTIONS = [
+    "What is the total amount due on the latest invoice?",
+    "When is the next bill due?",
+    "Summarize the services listed in the report.",
+    "Which documents were issued in May 2025?",
+]
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def send(url, conversation_id, question, stream, timeout):
+    """Send one message, returning (latency, time to first token)."""
+    body = json.dumps({"message": question, "stream": stream}).encode()
+    request = urllib.request.Request(
+        f"{url}/conversations/{conversation_id}/messages",
+        data=body,
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    start = time.perf_counter()
+    first_token = None
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        if not stream:
+            json.loads(response.read())
+        else:
+            for line in response:
+                if not line.startswith(b"data: "):
+                    continue
+                event = json.loads(line[len(b"data: "):])
+                if event["type"] == "error":
+                    raise RuntimeError(event["error"])
+                if event["type"] == "token" and first_token is None:
+                    first_token = time.perf_counter() - start
+    return time.perf_counter() - start, first_token
+
+def run(args):
+    """Fire the requests and print the report."""
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions) as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    conversations = [f"load-{uuid.uuid4().hex[:8]}" for _ in range(args.conversations)]
+    latencies, first_tokens, errors = [], [], []
+    lock = threading.Lock()
+
+    def task(i):
+        try:
+            latency, first_token = send(args.url, conversations[i % len(conversations)],
+                                        questions[i % len(questions)], args.stream, args.timeout)
+            with lock:
+                latencies.append(latency)
+                if first_token is not None:
+                    first_tokens.append(first_token)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(task, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    print(f"requests:    {args.requests} ({len(errors)} errors) over {len(conversations)} conversations")
+    print(f"concurrency: {args.concurrency}")
+    print(f"elapsed:     {elapsed:.2f}s")
+    print(f"QPS:         {len(latencies) / elapsed:.2f}")
+    print("latency:     " + "  ".join(
+        f"p{pct}={percentile(latencies, pct):.2f}s" for pct in (50, 90, 95, 99)
+    ) + f"  max={max(latencies, default=0):.2f}s")
+    if first_tokens:
+        print("first token: " + "  ".join(
+            f"p{pct}={percentile(first_tokens, pct):.2f}s" for pct in (50, 90, 99)
+        ))
+    for error in errors[:5]:
+        print(f"error: {error}")
+    return 1 if errors else 0
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Load test the query API.")
+    parser.add_argument("--url", default="http://localhost:8000", help="Base URL of the API")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=100, help="Total requests to send")
+    parser.add_argument("--conversations", type=int, default=32, help="Distinct conversations to spread requests over")
+    parser.add_argument("--questions", help="File with one question per line")
+    parser.add_argument("--stream", action="store_true", help="Use streaming responses and report time to first token")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout in seconds")
+    return run(parser.parse_args(argv))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Local HTTP API over the query service.
+
+Usage:
+    uvicorn services.api:app --port 8000
+
+Endpoints:
+    POST   /conversations/{conversation_id}/messages   {"message": "...", "stream": false, "tenant": "default"}
+    DELETE /conversations/{conversation_id}
+    POST   /refresh
+    GET    /shards?tenant=...
+    GET    /cache
+    GET    /limits
+    GET    /embeddings
+    GET    /health
+
+With "stream": true the response is a server-sent event stream of node
+updates and answer tokens, ending with a "done" event carrying the answer.
+"""
+import json
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from utils.silencer import silence_common_warnings
+silence_common_warnings()
+
+from processors.document_processor import DEFAULT_TENANT, get_shard_stats, get_embeddings
+from services.query_service import get_query_service
+from nodes.response_cache import get_response_cache
+from utils.llm_limiter import get_limiter_metrics
+
+app = FastAPI(title="Business Document Assistant API")
+
+class MessageRequest(BaseModel):
+    message: str
+    stream: bool = False
+    tenant: str = DEFAULT_TENANT
+
+@app.on_event("startup")
+def startup():
+    """Load the graph and the shared index before serving requests"""
+    get_query_service()
+
+@app.get("/health")
+def health():
+    """Report whether the service is up and documents are loaded"""
+    return {"status": "ok", "documents_loaded": get_query_service().vectorstore() is not None}
+
+@app.get("/shards")
+def shards(tenant: str = None):
+    """Per-shard chunk counts, for one tenant or overall"""
+    return get_shard_stats(tenant)
+
+@app.get("/cache")
+def cache():
+    """Grader and rewriter response cache size and hit rates"""
+    return get_response_cache().stats()
+
+@app.get("/limits")
+def limits():
+    """Per-deployment LLM concurrency, queue depth and remaining rate budget"""
+    return get_limiter_metrics()
+
+@app.get("/embeddings")
+def embeddings():
+    """Embedding batch sizes, throughput, queue wait per lane and query cache hit rate"""
+    return get_embeddings().metrics()
+
+@app.post("/refresh")
+def refresh():
+    """Reload the shared index after new documents were ingested"""
+    return {"documents_loaded": get_query_service().refresh()}
+
+@app.post("/conversations/{conversation_id}/messages")
+def post_message(conversation_id: str, request: MessageRequest):
+    """Send a message to a conversation, optionally streaming the answer"""
+    service = get_query_service()
+    if not request.stream:
+        return {"conversation_id": conversation_id, "answer": service.ask(conversation_id, request.message, request.tenant)}
+
+    def events():
+        try:
+            for event in service.stream(conversation_id, request.message, request.tenant):
+                yield f"data: {json.dumps(event)}\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.delete("/conversations/{conversation_id}")
+def delete_conversation(conversation_id: str):
+    """Forget a conversation's history"""
+    get_query_service().reset(conversation_id)
+    return {"conversation_id": conversation_id, "deleted": True}
@@ -0,0 +1,148 @@
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+from langchain_core.messages import HumanMessage, AIMessageChunk
+
+from components.graph import initialize_graph, get_checkpointer
+from nodes.config import get_llm
+from processors.document_processor import load_vectorstore, refresh_vectorstore, create_retriever, tenant_slug, DEFAULT_TENANT
+from utils.graph_tracer import graph_tracer
+
+# Nodes whose LLM output is the answer shown to the user
+ANSWER_NODES = ("generate", "responder")
+# Tenants whose index stays open; the least recently used is dropped beyond this
+MAX_OPEN_TENANTS = int(os.environ.get("MAX_OPEN_TENANTS", "32"))
+
+class QueryService:
+    """
+    Runs the agent graph for many conversations against one shared index.
+
+    The graph, chat model and each tenant's vectorstore and retriever are
+    created once and injected into every run through the graph config, so no
+    Streamlit session is needed. Conversation history lives in the graph's
+    SQLite checkpointer under the conversation ID, so each turn sends only
+    the new message and conversations survive restarts. Turns within one
+    conversation are serialized; different conversations run concurrently.
+    """
+    def __init__(self):
+        """Compile the graph and open the default tenant's index"""
+        self.checkpointer = get_checkpointer()
+        self.graph = initialize_graph(self.checkpointer)
+        self.llm = get_llm(None)
+        # Tenant slug -> (tenant, vectorstore, retriever), for tenants with documents only
+        self.indexes: "OrderedDict[str, Tuple[str, Any, Any]]" = OrderedDict()
+        self._indexes_lock = threading.Lock()
+        # Conversation ID -> [lock, number of turns holding or waiting for it]
+        self._locks: Dict[str, list] = {}
+        self._locks_guard = threading.Lock()
+        self._set_vectorstore(DEFAULT_TENANT, load_vectorstore(DEFAULT_TENANT))
+
+    def _set_vectorstore(self, tenant: str, vectorstore) -> Tuple[Any, Any]:
+        """Swap in a tenant's vectorstore; runs already in flight keep the old one"""
+        retriever = create_retriever(vectorstore) if vectorstore else None
+        key = tenant_slug(tenant)
+        with self._indexes_lock:
+            if vectorstore is None:
+                # Not caching a miss, so documents ingested later are found without a refresh
+                self.indexes.pop(key, None)
+            else:
+                self.indexes[key] = (tenant, vectorstore, retriever)
+                self.indexes.move_to_end(key)
+                while len(self.indexes) > MAX_OPEN_TENANTS:
+                    self.indexes.popitem(last=False)
+        return vectorstore, retriever
+
+    def _index(self, tenant: str) -> Tuple[Any, Any]:
+        """Get a tenant's vectorstore and retriever, opening its shards if they aren't open"""
+        with self._indexes_lock:
+            index = self.indexes.get(tenant_slug(tenant))
+            if index is not None:
+                self.indexes.move_to_end(tenant_slug(tenant))
+                return index[1], index[2]
+        return self._set_vectorstore(tenant, load_vectorstore(tenant))
+
+    def vectorstore(self, tenant: str = DEFAULT_TENANT):
+        """Get a tenant's vectorstore, or None if it has no documents"""
+        return self._index(tenant)[0]
+
+    def refresh(self) -> bool:
+        """Reload every open index to pick up documents ingested by other processes"""
+        with self._indexes_lock:
+            tenants = [tenant for tenant, _, _ in self.indexes.values()] or [DEFAULT_TENANT]
+        for tenant in tenants:
+            self._set_vectorstore(tenant, refresh_vectorstore(tenant))
+        with self._indexes_lock:
+            return bool(self.indexes)
+
+    @contextmanager
+    def _lock(self, conversation_id: str):
+        """Serialize turns of one conversation, dropping its lock once no turn needs it"""
+        with self._locks_guard:
+            entry = self._locks.setdefault(conversation_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[conversation_id]
+
+    def _config(self, conversation_id: str, tenant: str) -> Dict[str, Any]:
+        """Build the graph config injecting the shared clients and the tenant's index"""
+        vectorstore, retriever = self._index(tenant)
+        return {"configurable": {
+            "thread_id": conversation_id,
+            "retriever": retriever,
+            "vectorstore": vectorstore,
+            "tenant": tenant,
+            "llm": self.llm,
+        }}
+
+    def ask(self, conversation_id: str, message: str, tenant: str = DEFAULT_TENANT) -> str:
+        """Run one turn and return the assistant's answer"""
+        with self._lock(conversation_id):
+            graph_tracer.clear_trace()
+            response = self.graph.invoke({"messages": [HumanMessage(message)]}, config=self._config(conversation_id, tenant))
+            return response["messages"][-1].content
+
+    def stream(self, conversation_id: str, message: str, tenant: str = DEFAULT_TENANT) -> Iterator[Dict[str, Any]]:
+        """Run one turn, yielding node updates and answer tokens as they are produced"""
+        with self._lock(conversation_id):
+            graph_tracer.clear_trace()
+            final_state: Optional[Dict[str, Any]] = None
+
+            for mode, payload in self.graph.stream(
+                {"messages": [HumanMessage(message)]},
+                config=self._config(conversation_id, tenant),
+                stream_mode=["messages", "updates", "values"],
+            ):
+                if mode == "messages":
+                    chunk, metadata = payload
+                    if isinstance(chunk, AIMessageChunk) and metadata.get("langgraph_node") in ANSWER_NODES and chunk.content:
+                        yield {"type": "token", "node": metadata["langgraph_node"], "content": chunk.content}
+                elif mode == "updates":
+                    for node in payload:
+                        yield {"type": "node", "node": node}
+                else:
+                    final_state = payload
+
+            yield {"type": "done", "answer": final_state["messages"][-1].content}
+
+    def reset(self, conversation_id: str):
+        """Forget a conversation's history"""
+        with self._lock(conversation_id):
+            self.checkpointer.delete_thread(conversation_id)
+
+# Global query service
+query_service = None
+
+def get_query_service() -> QueryService:
+    """Get or initialize the query service."""
+    global query_service
+    if query_service is None:
+        query_service = QueryService()
+    return query_service
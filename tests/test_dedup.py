@@ -0,0 +1,59 @@
+import os
+import json
+import multiprocessing
+from langchain_core.documents import Document
+from processors.dedup import NearDuplicateIndex
+from utils.sqlite import connect
+
+SHARD = "doc-rag-default--invoice"
+TEXT = "Payment is due within thirty days of the invoice date. Late payments accrue interest of 2% per month."
+
+def chunk(source, text=TEXT):
+    return Document(page_content=text, metadata={"source": source})
+
+def reserve_and_die(path):
+    """Reserve a chunk like an ingester would, then get killed before storing it"""
+    NearDuplicateIndex(path, 0.9).deduplicate(SHARD, [chunk("a.pdf")])
+    os._exit(1)
+
+def count_chunks(path):
+    with connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+def test_resume_after_crash_stores_the_document(tmp_path):
+    path = str(tmp_path / "dedup.db")
+    writer = multiprocessing.get_context("fork").Process(target=reserve_and_die, args=(path,))
+    writer.start()
+    writer.join()
+    assert count_chunks(path) == 1
+
+    # The resumed document is stored again instead of collapsing onto its dead reservation
+    index = NearDuplicateIndex(path, 0.9)
+    unique, updated = index.deduplicate(SHARD, [chunk("a.pdf")])
+    assert len(unique) == 1
+    assert updated == {}
+    assert count_chunks(path) == 1
+
+def test_chunks_only_collapse_onto_stored_chunks(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "dedup.db"), 0.9)
+    first, _ = index.deduplicate(SHARD, [chunk("a.pdf")])
+
+    # A reservation still in flight is not a representative yet
+    pending, _ = index.deduplicate(SHARD, [chunk("b.pdf")])
+    assert len(pending) == 1
+    index.release(pending)
+
+    index.mark_stored(first)
+    unique, updated = index.deduplicate(SHARD, [chunk("b.pdf")])
+    assert unique == []
+    assert updated == {first[0].id: ["a.pdf", "b.pdf"]}
+
+def test_chunks_with_different_figures_are_kept(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "dedup.db"), 0.9)
+    first, _ = index.deduplicate(SHARD, [chunk("a.pdf")])
+    index.mark_stored(first)
+
+    unique, updated = index.deduplicate(SHARD, [chunk("b.pdf", TEXT.replace("2%", "3%"))])
+    assert len(unique) == 1
+    assert json.loads(unique[0].metadata["sources"]) == ["b.pdf"]
+    assert updated == {}
@@ -1,41 +1,66 @@
+import threading
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from typing import Dict, List, Any, Optional
 
+# Entries kept per thread outside Streamlit, for threads that never clear their trace
+MAX_THREAD_TRACE = 500
+
 class GraphTracer:
     """
     Utility class for tracing and displaying graph execution steps
+
+    Inside a Streamlit script run the trace lives in the session state. Outside
+    of Streamlit (the query service, the CLI tools) each thread keeps its own
+    trace, so concurrent conversations don't interleave.
     """
     def __init__(self):
         """Initialize the graph tracer"""
-        if "graph_trace" not in st.session_state:
-            st.session_state.graph_trace = []
-        if "current_node" not in st.session_state:
-            st.session_state.current_node = None
-        if "node_decisions" not in st.session_state:
-            st.session_state.node_decisions = {}
-            
+        self._local = threading.local()
+
+    def _state(self):
+        """Get the trace storage for the current session or thread"""
+        if get_script_run_ctx() is not None:
+            state = st.session_state
+        else:
+            if not hasattr(self._local, "state"):
+                self._local.state = {}
+            state = self._local.state
+
+        if "graph_trace" not in state:
+            state["graph_trace"] = []
+        if "current_node" not in state:
+            state["current_node"] = None
+        if "node_decisions" not in state:
+            state["node_decisions"] = {}
+        return state
+
     def clear_trace(self):
         """Clear the current trace"""
-        st.session_state.graph_trace = []
-        st.session_state.current_node = None
-        st.session_state.node_decisions = {}
-    
-    def add_trace(self, node_name: str, state: Dict[str, Any] = None, decision: Optional[str] = None):
+        state = self._state()
+        state["graph_trace"] = []
+        state["current_node"] = None
+        state["node_decisions"] = {}
+
+    def add_trace(self, node_name: str, state: Dict[str, Any] = None, decision: Optional[str] = None,
+                  timings: Optional[Dict[str, float]] = None):
         """
         Add a trace entry for node execution
-        
+
         Args:
             node_name: Name of the node
             state: The current graph state (optional)
             decision: Decision made by this node (optional)
+            timings: Seconds spent per step within the node (optional)
         """
-        st.session_state.current_node = node_name
-        
+        store = self._state()
+        store["current_node"] = node_name
+
         trace_entry = {
             "node": node_name,
-            "timestamp": st.session_state.get("trace_counter", 0),
+            "timestamp": store.get("trace_counter", 0),
         }
-        
+
         if state:
             trace_entry["state_info"] = {}
             if "question" in state and state["question"]:
@@ -45,26 +70,31 @@ class GraphTracer:
             if "generation" in state and state["generation"]:
                 gen = state["generation"]
                 trace_entry["state_info"]["generation"] = (gen[:100] + "...") if len(gen) > 100 else gen
-        
+
+
+        if timings:
+            trace_entry["timings"] = timings
 
         if decision:
             trace_entry["decision"] = decision
-            st.session_state.node_decisions[node_name] = decision
-        
-        st.session_state.graph_trace.append(trace_entry)
+            store["node_decisions"][node_name] = decision
+
+        store["graph_trace"].append(trace_entry)
+        if store is not st.session_state and len(store["graph_trace"]) > MAX_THREAD_TRACE:
+            del store["graph_trace"][:-MAX_THREAD_TRACE]
+
+        store["trace_counter"] = store.get("trace_counter", 0) + 1
 
-        st.session_state["trace_counter"] = st.session_state.get("trace_counter", 0) + 1
-    
     def get_trace(self) -> List[Dict[str, Any]]:
         """Get the current trace"""
-        return st.session_state.graph_trace
-    
+        return self._state()["graph_trace"]
+
     def get_current_node(self) -> Optional[str]:
         """Get the currently executing node"""
-        return st.session_state.current_node
-    
+        return self._state()["current_node"]
+
     def get_node_decision(self, node_name: str) -> Optional[str]:
         """Get the decision made by a node"""
-        return st.session_state.node_decisions.get(node_name)
+        return self._state()["node_decisions"].get(node_name)
 
-graph_tracer = GraphTracer() 
\ No newline at end of file
+graph_tracer = GraphTracer()
@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import asyncio
+from functools import lru_cache
+from typing import Any, AsyncIterator, Iterator, List, Optional
+import openai
+import tiktoken
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_openai import AzureChatOpenAI
+from utils.llm_limiter import INTERACTIVE, BACKGROUND, MAX_RETRIES, Failure, get_limiter
+
+# Completion tokens reserved for calls that don't set max_tokens
+DEFAULT_COMPLETION_TOKENS = 512
+
+# Azure deployment names don't identify the model, so its tokenizer can be set per deployment
+# (an encoding or a model name): LLM_ENCODINGS='{"gpt-4-2": "o200k_base"}'
+DEPLOYMENT_ENCODINGS = json.loads(os.environ.get("LLM_ENCODINGS", "{}"))
+DEFAULT_ENCODING = "cl100k_base"
+
+@lru_cache(maxsize=None)
+def get_encoding(deployment_name: str) -> tiktoken.Encoding:
+    """Tokenizer of a deployment: the configured one, else the one its name implies, else cl100k_base."""
+    for name in (DEPLOYMENT_ENCODINGS.get(deployment_name), deployment_name):
+        if not name:
+            continue
+        try:
+            return tiktoken.get_encoding(name)
+        except ValueError:
+            pass
+        try:
+            return tiktoken.encoding_for_model(name)
+        except KeyError:
+            pass
+    return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+def classify_error(error: BaseException) -> Failure:
+    """Decide whether an Azure OpenAI error is worth retrying."""
+    if isinstance(error, openai.RateLimitError):
+        retry_after = None
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        if headers.get("retry-after-ms"):
+            retry_after = float(headers["retry-after-ms"]) / 1000
+        elif headers.get("retry-after"):
+            try:
+                retry_after = float(headers["retry-after"])
+            except ValueError:
+                pass
+        return Failure(retryable=True, rate_limited=True, retry_after=retry_after)
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)):
+        return Failure(retryable=True, rate_limited=False)
+    return Failure(retryable=False, rate_limited=False)
+
+def result_tokens(result: ChatResult) -> Optional[int]:
+    """Total tokens reported for a completed call, if any."""
+    return ((result.llm_output or {}).get("token_usage") or {}).get("total_tokens")
+
+class LimitedAzureChatOpenAI(AzureChatOpenAI):
+    """
+    AzureChatOpenAI whose calls all go through the deployment's shared limiter.
+
+    The limiter handles rate limits, adaptive concurrency and retries, so the
+    client's own retries are disabled. `priority` decides who waits when the
+    deployment is saturated: interactive chat or background ingestion.
+    """
+    priority: int = INTERACTIVE
+
+    def _estimate_tokens(self, messages: List[BaseMessage], kwargs: dict) -> int:
+        """Prompt tokens plus the completion budget, reserved before the call"""
+        encoding = get_encoding(self.deployment_name)
+        prompt = sum(len(encoding.encode(str(message.content))) for message in messages)
+        return prompt + (kwargs.get("max_tokens") or self.max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+    def _latency_class(self, kwargs: dict) -> str:
+        """Calls are judged slow against calls with the same completion budget, e.g. single-token verdicts"""
+        max_tokens = kwargs.get("max_tokens") or self.max_tokens
+        return f"max_tokens={max_tokens}" if max_tokens else "open"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                  **kwargs: Any) -> ChatResult:
+        return get_limiter(self.deployment_name).call(
+            lambda: super(LimitedAzureChatOpenAI, self)._generate(messages, stop, run_manager, **kwargs),
+            self._estimate_tokens(messages, kwargs), self.priority, classify_error, result_tokens,
+            self._latency_class(kwargs),
+        )
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                         **kwargs: Any) -> ChatResult:
+        return await get_limiter(self.deployment_name).acall(
+            lambda: super(LimitedAzureChatOpenAI, self)._agenerate(messages, stop, run_manager, **kwargs),
+            self._estimate_tokens(messages, kwargs), self.priority, classify_error, result_tokens,
+            self._latency_class(kwargs),
+        )
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        """Stream under the limiter; a call is only retried if it failed before its first chunk"""
+        limiter = get_limiter(self.deployment_name)
+        tokens = self._estimate_tokens(messages, kwargs)
+        attempt = 0
+        while True:
+            permit = limiter.acquire(tokens, self.priority, self._latency_class(kwargs))
+            start = time.monotonic()
+            started = False
+            outcome = "cancelled"
+            try:
+                for chunk in super()._stream(messages, stop, run_manager, **kwargs):
+                    started = True
+                    yield chunk
+                outcome = "ok"
+                return
+            except Exception as error:
+                failure = classify_error(error)
+                outcome = "rate_limited" if failure.rate_limited else "error"
+                if started or not failure.retryable or attempt == MAX_RETRIES:
+                    limiter.record_failure()
+                    raise
+                limiter.record_retry()
+            finally:
+                limiter.release(permit, time.monotonic() - start, outcome=outcome)
+            time.sleep(limiter.backoff_delay(attempt, failure))
+            attempt += 1
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        """Async stream under the limiter; a call is only retried if it failed before its first chunk"""
+        limiter = get_limiter(self.deployment_name)
+        tokens = self._estimate_tokens(messages, kwargs)
+        attempt = 0
+        while True:
+            permit = await limiter.aacquire(tokens, self.priority, self._latency_class(kwargs))
+            start = time.monotonic()
+            started = False
+            outcome = "cancelled"
+            try:
+                async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+                    started = True
+                    yield chunk
+                outcome = "ok"
+                return
+            except Exception as error:
+                failure = classify_error(error)
+                outcome = "rate_limited" if failure.rate_limited else "error"
+                if started or not failure.retryable or attempt == MAX_RETRIES:
+                    limiter.record_failure()
+                    raise
+                limiter.record_retry()
+            finally:
+                limiter.release(permit, time.monotonic() - start, outcome=outcome)
+            await asyncio.sleep(limiter.backoff_delay(attempt, failure))
+            attempt += 1
+
+def create_chat_model(deployment_name: str, background: bool = False, **kwargs: Any) -> LimitedAzureChatOpenAI:
+    """Create a chat model for a deployment whose calls go through its shared limiter."""
+    return LimitedAzureChatOpenAI(
+        deployment_name=deployment_name,
+        priority=BACKGROUND if background else INTERACTIVE,
+        max_retries=0,
+        **kwargs,
+    )
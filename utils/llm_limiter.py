@@ -0,0 +1,370 @@
+import os
+import json
+import time
+import heapq
+import random
+import asyncio
+import threading
+import itertools
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+from utils.sqlite import connect
+
+# Priorities; lower is served first
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Per-deployment quotas, overridable with LLM_RATE_LIMITS='{"gpt-4-2": {"rpm": 300, "tpm": 50000}}'
+DEFAULT_REQUESTS_PER_MINUTE = 300
+DEFAULT_TOKENS_PER_MINUTE = 50000
+RATE_LIMITS = json.loads(os.environ.get("LLM_RATE_LIMITS", "{}"))
+# Budgets shared by every process calling the deployments (app, API, worker, bulk ingestion)
+LIMITS_DATABASE = os.path.join(os.getcwd(), "llm_limits.db")
+# AIMD concurrency bounds
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 32
+INITIAL_CONCURRENCY = 8
+# Multiplicative decrease on a 429, and on a call slower than LATENCY_FACTOR times the recent average
+# of its own class (priority and completion budget), so short verdicts don't make every answer look slow
+RATE_LIMIT_BACKOFF = 0.5
+LATENCY_BACKOFF = 0.9
+LATENCY_FACTOR = 2.0
+# Background work never takes more than this share of the concurrency limit
+BACKGROUND_SHARE = 0.5
+# Share of each rate budget background work leaves untouched, so chat calls of any process get through first
+INTERACTIVE_RESERVE = 0.25
+# Retries with full-jitter exponential backoff
+MAX_RETRIES = 6
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+# Async waiters poll for a permit at this interval, so cancelling them never leaks one
+ASYNC_POLL_INTERVAL = 0.02
+
+@dataclass
+class Permit:
+    """One admitted call and the tokens reserved for it"""
+    tokens: int
+    priority: int
+    queued_for: float
+    latency_class: str = ""
+
+@dataclass
+class Failure:
+    """How a failed call should be handled"""
+    retryable: bool
+    rate_limited: bool
+    retry_after: Optional[float] = None
+
+class SharedBudget:
+    """
+    Refilling per-minute budgets of requests and tokens for one deployment.
+
+    The balances live in a SQLite database shared by every process, so the
+    app, the API, the worker and bulk ingestion together stay within the
+    deployment's quota. Background calls only draw while more than
+    INTERACTIVE_RESERVE of each budget is left, which keeps the rest for
+    interactive calls of whichever process makes them.
+    """
+    def __init__(self, deployment: str, requests_per_minute: float, tokens_per_minute: float,
+                 path: str = LIMITS_DATABASE):
+        """Open the budget database, creating the deployment's full budgets if needed"""
+        self.deployment = deployment
+        self.path = path
+        self.request_capacity = float(requests_per_minute)
+        self.token_capacity = float(tokens_per_minute)
+        with connect(self.path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS budgets (
+                    deployment TEXT PRIMARY KEY,
+                    requests REAL NOT NULL,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "INSERT OR IGNORE INTO budgets (deployment, requests, tokens, updated_at) VALUES (?, ?, ?, ?)",
+                (deployment, self.request_capacity, self.token_capacity, time.time()),
+            )
+
+    def _refilled(self, conn) -> Tuple[float, float]:
+        """Balances with the budget accrued since the last update, inside a write transaction"""
+        row = conn.execute(
+            "SELECT requests, tokens, updated_at FROM budgets WHERE deployment = ?", (self.deployment,)
+        ).fetchone()
+        elapsed = max(0.0, time.time() - row["updated_at"])
+        requests = min(self.request_capacity, row["requests"] + elapsed * self.request_capacity / 60)
+        tokens = min(self.token_capacity, row["tokens"] + elapsed * self.token_capacity / 60)
+        return requests, tokens
+
+    def _store(self, conn, requests: float, tokens: float):
+        """Write the balances back"""
+        conn.execute(
+            "UPDATE budgets SET requests = ?, tokens = ?, updated_at = ? WHERE deployment = ?",
+            (requests, tokens, time.time(), self.deployment),
+        )
+
+    def take(self, tokens: int, priority: int) -> float:
+        """Draw one request and `tokens`, or return the seconds to wait before trying again"""
+        reserve = INTERACTIVE_RESERVE if priority == BACKGROUND else 0.0
+        tokens = min(tokens, self.token_capacity * (1 - reserve))
+        with connect(self.path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                requests_left, tokens_left = self._refilled(conn)
+                delay = max(
+                    (1 + reserve * self.request_capacity - requests_left) * 60 / self.request_capacity,
+                    (tokens + reserve * self.token_capacity - tokens_left) * 60 / self.token_capacity,
+                )
+                if delay <= 0:
+                    self._store(conn, requests_left - 1, tokens_left - tokens)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return max(0.0, delay)
+
+    def settle(self, tokens: float):
+        """Charge (or refund, if negative) the difference between reported usage and the estimate"""
+        with connect(self.path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                requests_left, tokens_left = self._refilled(conn)
+                self._store(conn, requests_left, tokens_left - tokens)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def available(self) -> Tuple[float, float]:
+        """Requests and tokens currently left across all processes"""
+        with connect(self.path) as conn:
+            return self._refilled(conn)
+
+class DeploymentLimiter:
+    """
+    Admission control for one model deployment.
+
+    Calls wait in a priority queue (interactive before background, FIFO
+    within a priority) until a concurrency slot of this process and a
+    request and enough tokens of the budget shared by all processes are
+    free. The concurrency limit follows AIMD: it grows by one slot per
+    limit's worth of fast successes and is cut multiplicatively on 429s and
+    on latency spikes, judged against the average of calls of the same
+    priority and latency class. Failed calls are retried with jittered exponential
+    backoff, honouring Retry-After.
+    """
+    def __init__(self, deployment: str, requests_per_minute: float, tokens_per_minute: float):
+        """Create the buckets and queue of a deployment"""
+        self.deployment = deployment
+        self.budget = SharedBudget(deployment, requests_per_minute, tokens_per_minute)
+        self.limit = float(INITIAL_CONCURRENCY)
+        self.in_flight = {INTERACTIVE: 0, BACKGROUND: 0}
+        # (priority, latency class) -> average latency
+        self.latency_averages: Dict[Tuple[int, str], float] = {}
+        self.counters = {"calls": 0, "rate_limited": 0, "retries": 0, "failures": 0, "latency_backoffs": 0}
+        self.queue_wait_total = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def _grant(self, entry, priority: int, tokens: int) -> Tuple[bool, float]:
+        """Admit the waiter if it is next and capacity allows; otherwise how long to wait at most"""
+        if self._waiters[0] is not entry:
+            return False, 1.0
+        slots = int(self.limit)
+        if priority == BACKGROUND:
+            slots = max(1, int(self.limit * BACKGROUND_SHARE))
+            in_use = self.in_flight[BACKGROUND]
+        else:
+            in_use = sum(self.in_flight.values())
+        if in_use >= slots or sum(self.in_flight.values()) >= int(self.limit):
+            return False, 1.0
+
+        delay = self.budget.take(tokens, priority)
+        if delay > 0:
+            return False, delay
+
+        heapq.heappop(self._waiters)
+        self.in_flight[priority] += 1
+        # The next waiter is now at the head of the queue
+        self._condition.notify_all()
+        return True, 0.0
+
+    def _enqueue(self, priority: int):
+        """Add a waiter to the priority queue"""
+        entry = [priority, next(self._sequence)]
+        heapq.heappush(self._waiters, entry)
+        return entry
+
+    def _dequeue(self, entry):
+        """Remove a waiter that gave up"""
+        if entry in self._waiters:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+            self._condition.notify_all()
+
+    def acquire(self, tokens: int, priority: int = INTERACTIVE, latency_class: str = "") -> Permit:
+        """Block until a call may start"""
+        start = time.monotonic()
+        with self._condition:
+            entry = self._enqueue(priority)
+            try:
+                while True:
+                    granted, delay = self._grant(entry, priority, tokens)
+                    if granted:
+                        return Permit(tokens, priority, time.monotonic() - start, latency_class)
+                    self._condition.wait(delay)
+            except BaseException:
+                self._dequeue(entry)
+                raise
+
+    async def aacquire(self, tokens: int, priority: int = INTERACTIVE, latency_class: str = "") -> Permit:
+        """Wait without blocking the event loop until a call may start"""
+        start = time.monotonic()
+        with self._condition:
+            entry = self._enqueue(priority)
+        try:
+            while True:
+                with self._condition:
+                    granted, _ = self._grant(entry, priority, tokens)
+                if granted:
+                    return Permit(tokens, priority, time.monotonic() - start, latency_class)
+                await asyncio.sleep(ASYNC_POLL_INTERVAL)
+        except BaseException:
+            with self._condition:
+                self._dequeue(entry)
+            raise
+
+    def release(self, permit: Permit, latency: float, used_tokens: Optional[int] = None, outcome: str = "ok"):
+        """Return a permit and adapt the concurrency limit to how the call went (ok, rate_limited, error, cancelled)"""
+        with self._condition:
+            self.in_flight[permit.priority] -= 1
+            self.counters["calls"] += 1
+            self.queue_wait_total += permit.queued_for
+            if used_tokens is not None and used_tokens != permit.tokens:
+                # Settling the estimate against the reported usage
+                self.budget.settle(used_tokens - permit.tokens)
+
+            if outcome == "rate_limited":
+                self.counters["rate_limited"] += 1
+                self.limit = max(MIN_CONCURRENCY, self.limit * RATE_LIMIT_BACKOFF)
+            elif outcome == "ok":
+                key = (permit.priority, permit.latency_class)
+                average = self.latency_averages.get(key)
+                if average is not None and latency > LATENCY_FACTOR * average:
+                    self.counters["latency_backoffs"] += 1
+                    self.limit = max(MIN_CONCURRENCY, self.limit * LATENCY_BACKOFF)
+                else:
+                    self.limit = min(MAX_CONCURRENCY, self.limit + 1 / self.limit)
+                self.latency_averages[key] = latency if average is None else 0.9 * average + 0.1 * latency
+            self._condition.notify_all()
+
+    @staticmethod
+    def backoff_delay(attempt: int, failure: Failure) -> float:
+        """Full-jitter exponential backoff, at least the server's Retry-After"""
+        delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+        return max(delay, failure.retry_after or 0.0)
+
+    def call(self, fn: Callable[[], Any], tokens: int, priority: int, classify: Callable[[BaseException], Failure],
+             usage: Callable[[Any], Optional[int]] = lambda result: None, latency_class: str = ""):
+        """Run a call under the limiter, retrying retryable failures"""
+        for attempt in range(MAX_RETRIES + 1):
+            permit = self.acquire(tokens, priority, latency_class)
+            start = time.monotonic()
+            try:
+                result = fn()
+            except Exception as error:
+                failure = classify(error)
+                self.release(permit, time.monotonic() - start, outcome="rate_limited" if failure.rate_limited else "error")
+                if not failure.retryable or attempt == MAX_RETRIES:
+                    self.record_failure()
+                    raise
+                self.record_retry()
+                time.sleep(self.backoff_delay(attempt, failure))
+                continue
+            except BaseException:
+                self.release(permit, time.monotonic() - start, outcome="cancelled")
+                raise
+            self.release(permit, time.monotonic() - start, usage(result))
+            return result
+
+    async def acall(self, fn: Callable[[], Any], tokens: int, priority: int, classify: Callable[[BaseException], Failure],
+                    usage: Callable[[Any], Optional[int]] = lambda result: None, latency_class: str = ""):
+        """Run an async call under the limiter, retrying retryable failures"""
+        for attempt in range(MAX_RETRIES + 1):
+            permit = await self.aacquire(tokens, priority, latency_class)
+            start = time.monotonic()
+            try:
+                result = await fn()
+            except Exception as error:
+                failure = classify(error)
+                self.release(permit, time.monotonic() - start, outcome="rate_limited" if failure.rate_limited else "error")
+                if not failure.retryable or attempt == MAX_RETRIES:
+                    self.record_failure()
+                    raise
+                self.record_retry()
+                await asyncio.sleep(self.backoff_delay(attempt, failure))
+                continue
+            except BaseException:
+                # Cancelled, e.g. a speculative grader that is no longer needed
+                self.release(permit, time.monotonic() - start, outcome="cancelled")
+                raise
+            self.release(permit, time.monotonic() - start, usage(result))
+            return result
+
+    def record_retry(self):
+        """Count a retried call"""
+        with self._condition:
+            self.counters["retries"] += 1
+
+    def record_failure(self):
+        """Count a call that failed for good"""
+        with self._condition:
+            self.counters["failures"] += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        """Saturation snapshot: concurrency, queue depth and remaining rate budget"""
+        requests_available, tokens_available = self.budget.available()
+        with self._condition:
+            in_flight = sum(self.in_flight.values())
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _ in self._waiters:
+                queued[PRIORITY_NAMES[priority]] += 1
+            return {
+                "deployment": self.deployment,
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": {PRIORITY_NAMES[p]: count for p, count in self.in_flight.items()},
+                "saturation": in_flight / max(1, int(self.limit)),
+                "queued": queued,
+                "requests_available": round(requests_available, 1),
+                "tokens_available": round(tokens_available),
+                "average_latency": {
+                    f"{PRIORITY_NAMES[priority]}/{latency_class or 'default'}": average
+                    for (priority, latency_class), average in self.latency_averages.items()
+                },
+                "average_queue_wait": self.queue_wait_total / max(1, self.counters["calls"]),
+                **self.counters,
+            }
+
+# Limiters per deployment, shared by every model client in the process
+limiters: Dict[str, DeploymentLimiter] = {}
+limiters_lock = threading.Lock()
+
+def get_limiter(deployment: str) -> DeploymentLimiter:
+    """Get or create the limiter of a deployment."""
+    with limiters_lock:
+        if deployment not in limiters:
+            limits = RATE_LIMITS.get(deployment, {})
+            limiters[deployment] = DeploymentLimiter(
+                deployment,
+                limits.get("rpm", DEFAULT_REQUESTS_PER_MINUTE),
+                limits.get("tpm", DEFAULT_TOKENS_PER_MINUTE),
+            )
+        return limiters[deployment]
+
+def get_limiter_metrics():
+    """Saturation metrics of every deployment used in this process."""
+    with limiters_lock:
+        current = list(limiters.values())
+    return [limiter.metrics() for limiter in current]
@@ -0,0 +1,18 @@
+import sqlite3
+from contextlib import contextmanager
+
+@contextmanager
+def connect(path: str):
+    """
+    Open an autocommit connection to a SQLite database shared between processes.
+
+    WAL lets readers (the UI, the API) run while a worker or ingester writes;
+    callers that need atomic read-modify-write open their own BEGIN IMMEDIATE.
+    """
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    try:
+        yield conn
+    finally:
+        conn.close()